@@ -0,0 +1,70 @@
+"""節 (Matchday) 計算のベンチマーク: 旧実装 (drop_duplicates + merge) と derive_matchday の比較
+
+使い方: python benchmarks/bench_matchday.py [--seasons 1 5 10] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from streamlit_project import derive_matchday  # noqa: E402
+from synthetic_data import make_league_frame  # noqa: E402
+
+
+def make_frame(seasons: int, seed: int = 0) -> pd.DataFrame:
+    """複数シーズン分の選手単位の合成データから (Team, Match ID, Match Date) を取り出す"""
+    df = make_league_frame('J1', seasons=seasons, player_level=True, seed=seed)[['Team', 'Match ID', 'Match Date']]
+    df['Match Date'] = pd.to_datetime(df['Match Date'])
+    return df
+
+
+def legacy_matchday(df: pd.DataFrame) -> pd.DataFrame:
+    """旧実装: ユニーク試合の抽出・ソート・cumcount の後に全行へmergeする"""
+    unique_matches = df[['Team', 'Match ID', 'Match Date']].drop_duplicates()
+    unique_matches = unique_matches.sort_values(by=['Team', 'Match Date']).reset_index(drop=True)
+    unique_matches['Matchday'] = unique_matches.groupby('Team').cumcount() + 1
+    df = pd.merge(df, unique_matches[['Team', 'Match ID', 'Matchday']], on=['Team', 'Match ID'], how='left')
+    df = df.dropna(subset=['Matchday'])
+    df['Matchday'] = df['Matchday'].astype(int)
+    return df
+
+
+def vectorized_matchday(df: pd.DataFrame) -> pd.DataFrame:
+    df['Matchday'] = derive_matchday(df)
+    return df
+
+
+def best_of(func, df: pd.DataFrame, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        frame = df.copy()
+        start = time.perf_counter()
+        func(frame)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seasons', type=int, nargs='+', default=[1, 5, 10])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'seasons':>8} {'rows':>9} {'legacy [ms]':>12} {'vectorized [ms]':>16} {'speedup':>8}")
+    for seasons in args.seasons:
+        df = make_frame(seasons)
+        expected = legacy_matchday(df.copy())['Matchday'].to_numpy()
+        actual = vectorized_matchday(df.copy())['Matchday'].to_numpy()
+        assert np.array_equal(expected, actual), '旧実装と節番号が一致しません'
+
+        legacy = best_of(legacy_matchday, df, args.repeat)
+        vectorized = best_of(vectorized_matchday, df, args.repeat)
+        print(f'{seasons:>8} {len(df):>9} {legacy * 1e3:>12.1f} {vectorized * 1e3:>16.1f} {legacy / vectorized:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""カスタムランキング表の描画バックエンドのベンチマーク
+
+使い方: python benchmarks/bench_ranking_table.py [--repeat 5] [--out 出力先フォルダ]
+--out を指定すると各バックエンドの出力画像を保存するので、見た目を比較できる。
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from streamlit_project import (  # noqa: E402
+    RANKING_TABLE_BACKENDS, TEAM_COLORS, build_aggregate_cube, build_custom_ranking_table, render_ranking_image,
+)
+from synthetic_data import make_league_frame  # noqa: E402
+
+
+def make_cube(seed: int = 0) -> pd.DataFrame:
+    """合成データ (J1の1シーズン分) から集計キューブを作る"""
+    return build_aggregate_cube(make_league_frame('J1', seed=seed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--out', default=None)
+    args = parser.parse_args()
+
+    table = build_custom_ranking_table(make_cube(), 'Total', 'Distance')
+    focal_team = table['Team'].iloc[len(table) // 2]
+    baseline = None
+    print(f"{'backend':>20} {'best [ms]':>10} {'size [KB]':>10} {'speedup':>8}")
+    for backend in RANKING_TABLE_BACKENDS:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            image, image_format = render_ranking_image(table, focal_team, TEAM_COLORS[focal_team], 'Total', 'Distance', backend=backend)
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        baseline = baseline or best
+        print(f'{backend:>20} {best * 1e3:>10.1f} {len(image) / 1024:>10.1f} {baseline / best:>7.1f}x')
+        if args.out:
+            os.makedirs(args.out, exist_ok=True)
+            with open(os.path.join(args.out, f'ranking_{backend}.{image_format}'), 'wb') as f:
+                f.write(image)
+
+
+if __name__ == '__main__':
+    main()
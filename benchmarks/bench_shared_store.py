@@ -0,0 +1,91 @@
+"""複数ワーカープロセスのデータ用メモリの比較: 各プロセスで読み込む (read_feather) か、共有ストアをメモリマップで参照するか
+
+使い方: python benchmarks/bench_shared_store.py [--workers 1 4] [--seasons 10]
+Linux の /proc/self/smaps_rollup を使う。全ワーカーが同時にデータを保持した状態で、
+ロード前からの Private (そのプロセスだけが持つメモリ) と PSS (共有ページを按分したメモリ) の増加を測る。
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import streamlit_project as app  # noqa: E402
+from synthetic_data import make_league_frame  # noqa: E402
+
+MODES = ['read_feather', 'shared_mmap']
+
+
+def memory_kb() -> dict:
+    """このプロセスの Private と PSS (KB)"""
+    values = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                values[parts[0][:-1]] = int(parts[1])
+    return {'private': values.get('Private_Clean', 0) + values.get('Private_Dirty', 0), 'pss': values.get('Pss', 0)}
+
+
+def worker(mode: str, work_dir: str, barrier, results):
+    os.chdir(work_dir)
+    before = memory_kb()
+    frames = []
+    for league_key in app.LEAGUE_FILE_MAP:
+        cache_path = app._partition_cache_paths(app.partition_file_name(league_key, app.DEFAULT_SEASON))[0]
+        frames.append(app.attach_shared_frame(cache_path) if mode == 'shared_mmap' else app.pd.read_feather(cache_path))
+    # 全列を一度読んで、メモリマップのページを実際に参照させる
+    for df in frames:
+        for column in app.available_vars:
+            df[column].sum()
+    barrier.wait()  # 全ワーカーがデータを保持した状態で計測する
+    after = memory_kb()
+    results.put({key: (after[key] - before[key]) / 1024 for key in after})
+    barrier.wait()
+
+
+def run(work_dir: str, args):
+    """work_dir に合成データと共有ストアを作り、読み込み方・ワーカー数ごとのメモリを計測して表示する"""
+    os.makedirs(os.path.join(work_dir, app.DATA_DIR))
+    os.chdir(work_dir)
+    for league_key, file_name in app.LEAGUE_FILE_MAP.items():
+        make_league_frame(league_key, seasons=args.seasons, player_level=True).to_csv(os.path.join(app.DATA_DIR, file_name), index=False)
+        app.load_league_frame(league_key)  # 共有ストアへ公開
+    data_mb = sum(os.path.getsize(os.path.join(app.CACHE_DIR, name)) for name in os.listdir(app.CACHE_DIR)) / 1024 ** 2
+    print(f'共有ストアのサイズ: {data_mb:.1f} MB')
+
+    context = multiprocessing.get_context('spawn')
+    print(f"{'mode':>14} {'workers':>8} {'private/worker [MB]':>20} {'PSS/worker [MB]':>16} {'PSS total [MB]':>15}")
+    for mode in MODES:
+        for workers in args.workers:
+            barrier = context.Barrier(workers)
+            results = context.Queue()
+            processes = [context.Process(target=worker, args=(mode, work_dir, barrier, results)) for _ in range(workers)]
+            for process in processes:
+                process.start()
+            measured = [results.get() for _ in processes]
+            for process in processes:
+                process.join()
+            private = sum(m['private'] for m in measured) / workers
+            pss = sum(m['pss'] for m in measured)
+            print(f'{mode:>14} {workers:>8} {private:>20.1f} {pss / workers:>16.1f} {pss:>15.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--seasons', type=int, default=10)
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    # 合成データと共有ストア (Featherファイル) は一時フォルダに作り、終了時に削除する
+    with tempfile.TemporaryDirectory(prefix='jleague_shared_') as work_dir:
+        try:
+            run(work_dir, args)
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    main()
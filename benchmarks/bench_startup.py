@@ -0,0 +1,69 @@
+"""ワーカーのコールドスタートの計測: モジュールのimport時間と、HOME画面を初めて表示するまでの時間・メモリ (RSS)
+
+使い方: data/ があるフォルダで python benchmarks/bench_startup.py [--repeat 5] [--script 比較するstreamlit_project.py]
+毎回新しいPythonプロセスで計測し、中央値を表示する。どの描画ライブラリが読み込まれたかも表示する。
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+SCRIPT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'streamlit_project.py')
+BACKEND_MODULES = ['plotly.express', 'plotly.graph_objects', 'altair', 'matplotlib.pyplot', 'seaborn', 'xlsxwriter']
+STAGES = ['import', 'home']
+
+
+def rss_mb() -> float:
+    """このプロセスの現在のRSS (MB)"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return float('nan')
+
+
+def measure(stage: str, script: str):
+    """子プロセス側: 1回分を計測してJSONで出力する"""
+    start = time.perf_counter()
+    if stage == 'import':
+        import importlib.util
+        spec = importlib.util.spec_from_file_location('streamlit_project', script)
+        spec.loader.exec_module(importlib.util.module_from_spec(spec))
+    else:
+        from streamlit.testing.v1 import AppTest
+        at = AppTest.from_file(script, default_timeout=300)
+        at.run()
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(json.dumps({'ms': elapsed_ms, 'rss_mb': rss_mb(), 'loaded': [name for name in BACKEND_MODULES if name in sys.modules]}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--script', default=SCRIPT_PATH)
+    parser.add_argument('--measure', choices=STAGES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    script = os.path.abspath(args.script)
+    if args.measure:
+        measure(args.measure, script)
+        return
+
+    print(f"{'stage':>8} {'time [ms]':>10} {'RSS [MB]':>9}  loaded backends")
+    for stage in STAGES:
+        runs = []
+        for _ in range(args.repeat):
+            env = dict(os.environ, JLEAGUE_PERF_LOG='0')
+            result = subprocess.run([sys.executable, os.path.abspath(__file__), '--measure', stage, '--script', script],
+                                    capture_output=True, text=True, env=env, check=True)
+            runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+        runs.sort(key=lambda run: run['ms'])
+        median = runs[len(runs) // 2]
+        print(f"{stage:>8} {median['ms']:>10.1f} {median['rss_mb']:>9.1f}  {', '.join(median['loaded']) or '-'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""タブのフラグメント化で1回のウィジェット操作あたりに省略できる時間の計測
+
+使い方: data/ があるフォルダで python benchmarks/bench_tab_fragments.py [--league J1] [--repeat 3]
+AppTest はフラグメント内の操作でもスクリプト全体を再実行するので、全体再実行の時間と、
+render_league_tab が記録した操作タブ自身の描画時間を並べて、フラグメント再実行で省略できる時間を求める。
+"""
+import argparse
+import os
+import time
+
+from streamlit.testing.v1 import AppTest
+
+SCRIPT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'streamlit_project.py')
+
+# (タブ名, ウィジェットのキー書式, 操作で順番に設定する値)
+INTERACTIONS = [
+    ('集計ランキング', '{league}_ranking_method', ['Average', 'Max', 'Min', 'Total']),
+    ('カスタムランキング', 'rank_method_{league}', ['Average', 'Max', 'Min', 'Total']),
+    ('シーズン動向分析', 'trend_var_{league}', ['Sprint Count', 'HI Distance', 'Distance']),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--league', default='J1')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    at = AppTest.from_file(SCRIPT_PATH, default_timeout=300)
+    at.run()
+    at.sidebar.selectbox(key='league_selector').set_value(args.league).run()
+
+    print(f"{'tab':>16} {'full rerun [ms]':>16} {'fragment [ms]':>14} {'saved [ms]':>11} {'saved [%]':>10}")
+    for tab_name, key_format, values in INTERACTIONS:
+        full_times, tab_times = [], []
+        for _ in range(args.repeat):
+            for value in values:
+                start = time.perf_counter()
+                at.selectbox(key=key_format.format(league=args.league)).set_value(value).run()
+                full_times.append((time.perf_counter() - start) * 1000)
+                tab_times.append(at.session_state['tab_render_ms'][(args.league, tab_name)])
+        full_ms = sorted(full_times)[len(full_times) // 2]
+        tab_ms = sorted(tab_times)[len(tab_times) // 2]
+        saved_ms = full_ms - tab_ms
+        print(f'{tab_name:>16} {full_ms:>16.1f} {tab_ms:>14.1f} {saved_ms:>11.1f} {saved_ms / full_ms * 100:>9.0f}%')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""ダッシュボードの主要処理を合成データでヘッドレスに計測し、結果をJSONに書き出す
+
+使い方: python benchmarks/run_benchmarks.py [--scales season ten_seasons player] [--repeat 5]
+                                            [--out bench_results.json] [--baseline 前回の結果.json] [--tolerance 1.25]
+--baseline を指定すると、前回の結果より tolerance 倍以上遅くなった処理を表示し、終了コード1で終わる (デプロイ前の確認用)。
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import streamlit_project as app  # noqa: E402
+from synthetic_data import SCALES, write_league_csvs  # noqa: E402
+
+LEAGUE_KEY = 'J1'
+
+
+def time_stage(func, repeat: int, setup=None) -> dict:
+    """func を repeat 回実行し、最速値と中央値 (ms) を返す。setup の戻り値を毎回 func に渡す"""
+    timings = []
+    for _ in range(repeat):
+        argument = setup() if setup else None
+        start = time.perf_counter()
+        func(argument) if setup else func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {'best_ms': round(min(timings), 3), 'median_ms': round(float(np.median(timings)), 3), 'repeat': repeat}
+
+
+def run_scale(scale: str, repeat: int) -> dict:
+    """1つの規模の合成データを作り、各処理の時間を計測する"""
+    work_dir = tempfile.mkdtemp(prefix=f'jleague_bench_{scale}_')
+    cwd = os.getcwd()
+    try:
+        write_league_csvs(os.path.join(work_dir, app.DATA_DIR), scale)
+        # アプリは data/ を相対パスで読むので、作業フォルダを移して計測する
+        os.chdir(work_dir)
+
+        stages = {}
+        stages['load_csv'] = time_stage(
+            lambda _: app.load_league_frame(LEAGUE_KEY), repeat,
+            setup=lambda: shutil.rmtree(app.CACHE_DIR, ignore_errors=True),
+        )
+        stages['load_cache'] = time_stage(lambda: app.load_league_frame(LEAGUE_KEY), repeat)
+        df = app.load_league_frame(LEAGUE_KEY)
+
+        raw = pd.read_csv(os.path.join(app.DATA_DIR, app.LEAGUE_FILE_MAP[LEAGUE_KEY]))
+        stages['prepare_frame'] = time_stage(lambda frame: app.prepare_league_frame(frame, LEAGUE_KEY), repeat, setup=raw.copy)
+        stages['derive_matchday'] = time_stage(lambda: app.derive_matchday(df), repeat)
+
+        stages['aggregate_cube'] = time_stage(lambda: app.build_aggregate_cube(df), repeat)
+        cube = app.build_aggregate_cube(df)
+
+        def all_ranking_views():
+            for method in app.RANKING_METHODS:
+                for var in app.ranking_var_options(method):
+                    app.build_ranking_plot_data(cube[method][[var.replace(' (km)', '')]].reset_index(), method, var)
+        stages['ranking_views'] = time_stage(all_ranking_views, repeat)
+
+        # グラフのspec: 作成時間と、ブラウザへ送るJSONのサイズ (全指標の列を載せた場合との比較)
+        view = app.build_ranking_plot_data(cube['Total'].reset_index(), 'Total', 'Distance (km)')
+        teams = view[0]['Team'].tolist()
+        color_domain = (teams, [app.TEAM_COLORS.get(team, '#888888') for team in teams])
+        stages['ranking_spec'] = time_stage(lambda: app.build_ranking_chart_spec(view, color_domain, 'Total', 'Distance (km)'), repeat)
+        payloads = {
+            'ranking_spec': app.payload_size(app.build_ranking_chart_spec(view, color_domain, 'Total', 'Distance (km)')),
+            'ranking_spec_all_columns': app.payload_size(
+                app.alt.Chart(cube['Total'].reset_index()).mark_bar().encode(y='Team:N', x='Distance:Q').to_dict()),
+        }
+        overview = cube['Average'].reset_index().assign(League=LEAGUE_KEY)
+        payloads['scatter_spec'] = app.payload_size(json.loads(app.build_scatter_figure(
+            overview, 'Running Distance', 'HSR Distance', 'リーグ', None, app.TEAM_COLORS, app.LEAGUE_COLOR_MAP).to_json()))
+
+        stages['match_table'] = time_stage(lambda: app.build_match_table(df), repeat)
+        match_table = app.build_match_table(df)
+        stages['trend_array'] = time_stage(lambda: app.build_trend_array(match_table), repeat)
+        trend_array = app.build_trend_array(match_table)
+
+        def all_trend_series():
+            for team in trend_array.team_index:
+                for metric in trend_array.metric_index:
+                    trend_array.series(team, metric)
+                    trend_array.opponent_series(team, metric)
+        stages['trend_series'] = time_stage(all_trend_series, repeat)
+
+        stages['ranking_excel'] = time_stage(lambda: app.to_excel(app.ranking_download_frame(cube, 'Total', 'Distance (km)')), repeat)
+        stages['league_workbook'] = time_stage(lambda: app.build_league_workbook(cube), repeat)
+
+        table = app.build_custom_ranking_table(cube, 'Total', 'Distance')
+        focal_team = table['Team'].iloc[len(table) // 2]
+        for backend in app.RANKING_TABLE_BACKENDS:
+            stages[f'ranking_image_{backend}'] = time_stage(
+                lambda: app.render_ranking_image(table, focal_team, app.TEAM_COLORS[focal_team], 'Total', 'Distance', backend=backend),
+                repeat,
+            )
+
+        # 最終節の行を後から追記する場合 (incoming の取り込み)
+        last_matchday = df['Matchday'].max()
+        history = df.loc[df['Matchday'] < last_matchday].reset_index(drop=True)
+        batch = raw.loc[raw['Match ID'].isin(df.loc[df['Matchday'] == last_matchday, 'Match ID'].astype(raw['Match ID'].dtype))]
+        stages['store_append'] = time_stage(
+            lambda store: store.append(batch), repeat,
+            setup=lambda: app.LeagueStore(LEAGUE_KEY, history.copy()),
+        )
+
+        return {'rows': len(df), 'memory_mb': round(app.frame_memory_mb(df), 3), 'stages': stages, 'payload_bytes': payloads}
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    """前回の結果より tolerance 倍以上遅くなった (規模, 処理, 前回, 今回) の一覧"""
+    regressions = []
+    for scale, scale_result in results['scales'].items():
+        previous_stages = baseline.get('scales', {}).get(scale, {}).get('stages', {})
+        for stage, timing in scale_result['stages'].items():
+            previous = previous_stages.get(stage)
+            if previous and timing['best_ms'] > previous['best_ms'] * tolerance:
+                regressions.append((scale, stage, previous['best_ms'], timing['best_ms']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=list(SCALES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--out', default='bench_results.json')
+    parser.add_argument('--baseline', default=None)
+    parser.add_argument('--tolerance', type=float, default=1.25)
+    args = parser.parse_args()
+
+    results = {
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'scales': {},
+    }
+    for scale in args.scales:
+        results['scales'][scale] = scale_result = run_scale(scale, args.repeat)
+        print(f"\n[{scale}] {scale_result['rows']} 行, {scale_result['memory_mb']:.1f} MB")
+        print(f"{'stage':>32} {'best [ms]':>10} {'median [ms]':>12}")
+        for stage, timing in scale_result['stages'].items():
+            print(f"{stage:>32} {timing['best_ms']:>10.1f} {timing['median_ms']:>12.1f}")
+        for name, size in scale_result['payload_bytes'].items():
+            print(f"{name:>32} {size / 1024:>10.1f} KB")
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f'\n結果を {args.out} に書き出しました')
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for scale, stage, previous_ms, current_ms in regressions:
+            print(f'[遅延] {scale}/{stage}: {previous_ms:.1f} ms -> {current_ms:.1f} ms')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
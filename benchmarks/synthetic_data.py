@@ -0,0 +1,142 @@
+"""SkillCorner形式のフィジカルデータを合成する (ベンチマーク・動作確認用)
+
+使い方: python benchmarks/synthetic_data.py [--scale season|ten_seasons|player] [--out data] [--split-seasons]
+列名は available_vars、チーム名は TEAM_COLORS をそのまま使い、各リーグ20チームの2回戦総当たりの日程を作る。
+--split-seasons を指定するとシーズンごとに {season}_{league}_physical_data.csv へ分けて書き出す。
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from streamlit_project import LEAGUE_FILE_MAP, TEAM_COLORS, available_vars  # noqa: E402
+
+# 規模のプリセット: (シーズン数, 選手単位の行にするか)
+SCALES = {
+    'season': (1, False),
+    'ten_seasons': (10, False),
+    'player': (1, True),
+}
+TEAMS_PER_LEAGUE = 20
+LAST_SEASON = 2025
+PLAYERS_PER_MATCH = 16  # 先発11人 + 交代5人
+SQUAD_SIZE = 28
+POSITION_GROUPS = ['Goalkeeper', 'Central Defender', 'Full Back', 'Midfield', 'Wide Attacker', 'Center Forward']
+
+# チーム単位 (1試合・1チーム) の各指標の平均値
+TEAM_METRIC_MEANS = {
+    'Distance': 115_000, 'Running Distance': 28_000, 'M/min': 118, 'HSR Distance': 8_000, 'Sprint Count': 120,
+    'HI Distance': 10_500, 'HI Count': 520,
+    'Distance TIP': 52_000, 'Running Distance TIP': 14_000, 'HSR Distance TIP': 4_200, 'HSR Count TIP': 190,
+    'Sprint Distance TIP': 1_300, 'Sprint Count TIP': 60,
+    'Distance OTIP': 50_000, 'Running Distance OTIP': 13_000, 'HSR Distance OTIP': 3_800, 'HSR Count OTIP': 175,
+    'Sprint Distance OTIP': 1_200, 'Sprint Count OTIP': 55,
+}
+RATE_METRICS = {'M/min'}  # 選手単位にしても合計を分割しない指標
+
+
+def league_teams(league_key: str, teams: int = TEAMS_PER_LEAGUE) -> list:
+    """TEAM_COLORS の並び (J1, J2, J3 の順に20チームずつ) からリーグのチームを取り出す"""
+    position = list(LEAGUE_FILE_MAP).index(league_key)
+    team_names = list(TEAM_COLORS)
+    start = (position * TEAMS_PER_LEAGUE) % len(team_names)
+    return (team_names[start:] + team_names[:start])[:teams]
+
+
+def double_round_robin(teams: list) -> list:
+    """サークル方式で2回戦総当たりの日程 [(節, ホーム, アウェイ), ...] を作る"""
+    rotation = list(teams)
+    rounds = len(rotation) - 1
+    fixtures = []
+    for round_index in range(rounds):
+        half = len(rotation) // 2
+        pairs = list(zip(rotation[:half], rotation[::-1][:half]))
+        for home, away in pairs:
+            fixtures.append((round_index + 1, home, away))
+            fixtures.append((round_index + 1 + rounds, away, home))
+        rotation = [rotation[0], rotation[-1], *rotation[1:-1]]
+    return sorted(fixtures)
+
+
+def make_league_frame(league_key: str = 'J1', seasons: int = 1, player_level: bool = False,
+                      teams: int = TEAMS_PER_LEAGUE, seed: int = 0) -> pd.DataFrame:
+    """1リーグ分の合成データ (CSVの列構成のまま、行はシャッフル済み) を作る"""
+    rng = np.random.default_rng([seed, list(LEAGUE_FILE_MAP).index(league_key)])
+    team_names = league_teams(league_key, teams)
+    fixtures = double_round_robin(team_names)
+    # チームごとの走力の傾向 (シーズンを通して一定)
+    strength = dict(zip(team_names, rng.normal(1.0, 0.04, len(team_names))))
+    league_offset = (list(LEAGUE_FILE_MAP).index(league_key) + 1) * 10_000_000
+
+    rows = {'Match ID': [], 'Match': [], 'Match Date': [], 'Season': [], 'Team': []}
+    for season in range(LAST_SEASON - seasons + 1, LAST_SEASON + 1):
+        start = pd.Timestamp(f'{season}-02-15')
+        for match_number, (matchday, home, away) in enumerate(fixtures):
+            match_id = league_offset + season * 1_000 + match_number
+            # 土日開催 (同じ節でも日付がばらつく)
+            date = (start + pd.Timedelta(days=7 * (matchday - 1) + int(rng.integers(0, 2)))).strftime('%Y-%m-%d')
+            for team in (home, away):
+                rows['Match ID'].append(match_id)
+                rows['Match'].append(f'{home} vs {away}')
+                rows['Match Date'].append(date)
+                rows['Season'].append(season)
+                rows['Team'].append(team)
+    df = pd.DataFrame(rows)
+
+    factor = df['Team'].map(strength).to_numpy() * rng.normal(1.0, 0.05, len(df))
+    metrics = {name: TEAM_METRIC_MEANS[name] * factor * rng.normal(1.0, 0.03, len(df)) for name in available_vars}
+
+    if player_level:
+        # 1チーム・1試合の値を出場選手に配分する (出場時間の短い交代選手ほど小さい)
+        repeat = PLAYERS_PER_MATCH
+        df = df.loc[df.index.repeat(repeat)].reset_index(drop=True)
+        shares = rng.dirichlet(np.r_[np.full(11, 6.0), np.full(repeat - 11, 1.5)], size=len(df) // repeat).ravel()
+        squad_numbers = np.concatenate([rng.choice(SQUAD_SIZE, repeat, replace=False) + 1 for _ in range(len(df) // repeat)])
+        df['Player'] = df['Team'] + ' #' + pd.Series(squad_numbers).astype(str)
+        df['Position Group'] = np.array(POSITION_GROUPS)[squad_numbers % len(POSITION_GROUPS)]
+        metrics = {
+            name: np.repeat(values, repeat) * (rng.normal(1.0, 0.1, len(df)) if name in RATE_METRICS else shares)
+            for name, values in metrics.items()
+        }
+
+    for name in available_vars:
+        values = metrics[name]
+        df[name] = np.round(values) if 'Count' in name else np.round(values, 2)
+    # CSVの並び順に依存しないよう行をシャッフル
+    return df.sample(frac=1.0, random_state=seed).reset_index(drop=True)
+
+
+def write_league_csvs(out_dir: str, scale: str = 'season', seed: int = 0, split_seasons: bool = False) -> list:
+    """全リーグの合成CSVを書き出し、書き出したファイルのパスを返す"""
+    seasons, player_level = SCALES[scale]
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for league_key, file_name in LEAGUE_FILE_MAP.items():
+        df = make_league_frame(league_key, seasons=seasons, player_level=player_level, seed=seed)
+        if split_seasons:
+            for season, season_df in df.groupby('Season'):
+                paths.append(os.path.join(out_dir, f'{season}_{league_key}_physical_data.csv'))
+                season_df.to_csv(paths[-1], index=False)
+        else:
+            paths.append(os.path.join(out_dir, file_name))
+            df.to_csv(paths[-1], index=False)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=list(SCALES), default='season')
+    parser.add_argument('--out', default='data')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--split-seasons', action='store_true')
+    args = parser.parse_args()
+
+    for path in write_league_csvs(args.out, args.scale, args.seed, args.split_seasons):
+        print(f'{path}: {os.path.getsize(path) / 1024:.0f} KB')
+
+
+if __name__ == '__main__':
+    main()
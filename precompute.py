@@ -0,0 +1,219 @@
+"""ダッシュボードの成果物 (集計表・動向配列・ランキング画像・xlsx・散布図) を事前計算して書き出す
+
+使い方: data/ があるフォルダで python precompute.py [--seasons 2025 2024] [--workers 4] [--backend matplotlib_batched]
+                                                   [--scatter-seasons 1] [--keep 3] [--force]
+夜間のデータ更新後に実行すると、アプリは初回のクリックでも計算せずに成果物をそのまま返す。
+artifacts/<バージョン>/ に書き出し、全て書き終えてから artifacts/CURRENT を置き換えて公開する。
+元CSVの内容が前回と同じなら何もしない (--force で作り直す)。
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import streamlit_project as app
+
+
+def partition_dir(season: int, league_key: str) -> str:
+    return f'{season}_{league_key}'
+
+
+def load_partition_cube(league_key: str, season: int) -> tuple:
+    """アプリの get_data と同じく共有ストアのパーティションを読み、(フレーム, 集計キューブ) を返す"""
+    df = app.load_league_frame(league_key, season)
+    components = app.read_published_components(league_key, season)
+    if components is None:
+        components = app.aggregate_components(df)
+    return df, app.cube_from_components(components)
+
+
+def prepare_partition(season: int, league_key: str) -> dict:
+    """パーティションを共有ストアに公開し、マニフェストの項目 (元CSVのsha256など) を返す"""
+    df = app.load_league_frame(league_key, season)
+    _, meta = app._partition_cache_state(league_key, app.partition_file_name(league_key, season))
+    return {'season': season, 'league': league_key, 'sha256': meta['sha256'], 'rows': len(df),
+            'path': partition_dir(season, league_key)}
+
+
+def build_partition_artifacts(out_dir: str, season: int, league_key: str) -> int:
+    """集計キューブ・動向配列・リーグ全体のxlsx"""
+    df, cube = load_partition_cube(league_key, season)
+    path = os.path.join(out_dir, partition_dir(season, league_key))
+    os.makedirs(path, exist_ok=True)
+    # アプリからメモリマップで参照できるよう、非圧縮の1バッチで書く
+    flat = app._flatten_components(cube)
+    flat.to_feather(os.path.join(path, 'cube.feather'), compression='uncompressed', chunksize=max(len(flat), 1))
+    written = 1
+    if not df.empty and 'Match ID' in df.columns:
+        trend_array = app.build_trend_array(app.build_match_table(df))
+        np.savez(os.path.join(path, 'trend.npz'), teams=np.array(trend_array.teams), metrics=np.array(trend_array.metrics),
+                 values=trend_array.values, opponents=trend_array.opponents,
+                 opponent_matchdays=trend_array.opponent_matchdays)
+        written += 1
+    with open(os.path.join(path, 'workbook.xlsx'), 'wb') as f:
+        f.write(app.build_league_workbook(cube))
+    return written + 1
+
+
+def build_method_artifacts(out_dir: str, season: int, league_key: str, ranking_method: str, backend: str) -> int:
+    """1つの集計方法の全指標のランキングxlsxと、全指標×全チームのカスタムランキング画像"""
+    _, cube = load_partition_cube(league_key, season)
+    path = os.path.join(out_dir, partition_dir(season, league_key))
+    metric_vars = set(cube.columns.get_level_values('Metric')) if not cube.empty else set()
+    written = 0
+
+    os.makedirs(os.path.join(path, 'rankings'), exist_ok=True)
+    for selected_ranking_var in app.ranking_var_options(ranking_method):
+        if selected_ranking_var.replace(' (km)', '') not in metric_vars:
+            continue
+        excel = app.to_excel(app.ranking_download_frame(cube, ranking_method, selected_ranking_var))
+        with open(os.path.join(path, 'rankings', app.artifact_file_name(ranking_method, selected_ranking_var, ext='xlsx')), 'wb') as f:
+            f.write(excel)
+        written += 1
+
+    if backend:
+        os.makedirs(os.path.join(path, 'images', backend), exist_ok=True)
+        for rank_var in app.available_vars:
+            if rank_var not in metric_vars:
+                continue
+            table = app.build_custom_ranking_table(cube, ranking_method, rank_var)
+            if table.empty:
+                continue
+            for team in cube.index:
+                image, image_format = app.render_ranking_image(table, team, app.TEAM_COLORS.get(team, '#000000'),
+                                                               ranking_method, rank_var, backend=backend)
+                file_name = app.artifact_file_name(ranking_method, rank_var, team, ext=image_format)
+                with open(os.path.join(path, 'images', backend, file_name), 'wb') as f:
+                    f.write(image)
+                written += 1
+    return written
+
+
+def build_scatter_artifacts(out_dir: str, season: int, league_keys: list, color_by: str, x_var: str) -> int:
+    """HOME画面の散布図 (チーム平均) の spec を、1つの色分け・X軸について全Y軸分"""
+    overview = app.build_league_overview({league_key: load_partition_cube(league_key, season)[1] for league_key in league_keys})
+    path = os.path.join(out_dir, 'seasons', str(season), 'scatter')
+    os.makedirs(path, exist_ok=True)
+    if overview.empty:
+        return 0
+    for y_var in app.available_vars:
+        fig = app.build_scatter_figure(overview, x_var, y_var, color_by, None, app.TEAM_COLORS, app.LEAGUE_COLOR_MAP)
+        with open(os.path.join(path, app.artifact_file_name(color_by, x_var, y_var, ext='json')), 'w', encoding='utf-8') as f:
+            f.write(fig.to_json())
+    return len(app.available_vars)
+
+
+def run_task(task: tuple) -> tuple:
+    kind, *args = task
+    start = time.perf_counter()
+    written = {'partition': build_partition_artifacts, 'method': build_method_artifacts, 'scatter': build_scatter_artifacts}[kind](*args)
+    return task, written, time.perf_counter() - start
+
+
+def content_hash(partitions: dict, backend: str, scatter_seasons: list) -> str:
+    """成果物の内容を決める入力 (元CSVの内容・形式のバージョン・画像のバックエンド・散布図のシーズン) のハッシュ"""
+    key = {
+        'format_version': app.ARTIFACT_FORMAT_VERSION,
+        'cache_format_version': app.CACHE_FORMAT_VERSION,
+        'backend': backend,
+        'scatter_seasons': scatter_seasons,
+        'partitions': {name: entry['sha256'] for name, entry in sorted(partitions.items())},
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def publish(version: str):
+    """CURRENT を置き換えて、書き終えたバージョンを公開する"""
+    tmp_path = os.path.join(app.ARTIFACT_DIR, f'CURRENT.{os.getpid()}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(app.ARTIFACT_DIR, 'CURRENT'))
+
+
+def prune_versions(keep: int):
+    """公開中を含む新しい keep 個のバージョンを残し、古いものを削除する (表示中のワーカーは削除後もファイルがなければ計算する)"""
+    current = app.current_artifact_version()
+    versions = sorted(name for name in os.listdir(app.ARTIFACT_DIR)
+                      if os.path.isdir(os.path.join(app.ARTIFACT_DIR, name)) and not name.startswith('.'))
+    for name in versions[:-keep] if keep > 0 else versions:
+        if name != current:
+            shutil.rmtree(os.path.join(app.ARTIFACT_DIR, name), ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seasons', type=int, nargs='+', default=None, help='既定は data/ にある全シーズン')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--backend', choices=[*app.RANKING_TABLE_BACKENDS, 'none'], default=app.RANKING_TABLE_BACKEND,
+                        help='ランキング画像のバックエンド (アプリの JLEAGUE_TABLE_BACKEND と揃える。none で画像を作らない)')
+    parser.add_argument('--scatter-seasons', type=int, default=1,
+                        help='散布図を事前計算する新しい方からのシーズン数 (指標の組み合わせごとに図を作るため重い。0 で作らない)')
+    parser.add_argument('--keep', type=int, default=3, help='残すバージョンの数')
+    parser.add_argument('--force', action='store_true')
+    args = parser.parse_args()
+    backend = None if args.backend == 'none' else args.backend
+
+    catalog = app.scan_data_catalog()
+    seasons = [season for season in catalog if args.seasons is None or season in args.seasons]
+    if not seasons:
+        print('対象のシーズンのデータがありません')
+        return
+    start = time.perf_counter()
+    # 'spawn': Streamlit等のスレッドを持つ親プロセスをforkしない
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        # 1. パーティションを共有ストアに公開 (以降のタスクはCSVを読まずにメモリマップで参照する)
+        entries = pool.map(prepare_partition, *zip(*[(season, league_key) for season in seasons for league_key in catalog[season]]))
+        partitions = {partition_dir(entry['season'], entry['league']): entry for entry in entries}
+        scatter_seasons = seasons[:args.scatter_seasons]
+        digest = content_hash(partitions, backend, scatter_seasons)
+        current = app.current_artifact_version()
+        if not args.force and current and app.read_artifact_manifest(current).get('content_hash') == digest:
+            print(f'元データに変更がないため、公開中の成果物 {current} をそのまま使います')
+            return
+        print(f'[prepare] {len(partitions)} パーティション: {time.perf_counter() - start:.1f} s')
+
+        # 2. リーグ×集計方法、シーズン×色分け×X軸ごとに並列で書き出す (画像の多い集計方法ごとのタスクが最も重い)
+        version = f"{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}-{digest[:8]}"
+        out_dir = os.path.join(app.ARTIFACT_DIR, f'.{version}.tmp')
+        tasks = []
+        for season in seasons:
+            for league_key in catalog[season]:
+                tasks += [('method', out_dir, season, league_key, ranking_method, backend) for ranking_method in app.RANKING_METHODS]
+                tasks.append(('partition', out_dir, season, league_key))
+        for season in scatter_seasons:
+            tasks += [('scatter', out_dir, season, catalog[season], color_by, x_var)
+                      for color_by in app.ARTIFACT_SCATTER_COLORINGS for x_var in app.available_vars]
+        total_files = 0
+        for task, written, elapsed in pool.map(run_task, tasks):
+            total_files += written
+            if task[0] != 'scatter':
+                print(f"[{task[0]}] {' '.join(map(str, task[2:5]))}: {written} ファイル, {elapsed:.1f} s")
+        print(f'[write] {len(tasks)} タスク, {total_files} ファイル: {time.perf_counter() - start:.1f} s')
+
+    manifest = {
+        'format_version': app.ARTIFACT_FORMAT_VERSION,
+        'cache_format_version': app.CACHE_FORMAT_VERSION,
+        'version': version,
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'content_hash': digest,
+        'backend': backend,
+        'partitions': partitions,
+        'seasons': {str(season): {'leagues': catalog[season], 'path': os.path.join('seasons', str(season))} for season in scatter_seasons},
+    }
+    with open(os.path.join(out_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(out_dir, os.path.join(app.ARTIFACT_DIR, version))
+    publish(version)
+    prune_versions(args.keep)
+    print(f'成果物 {version} を公開しました ({time.perf_counter() - start:.1f} s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,326 @@
 import pandas as pd
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-from vega_datasets import data
-import altair as alt
+from io import BytesIO, StringIO
+from collections import OrderedDict
+from pandas.api.types import union_categoricals
+import pyarrow as pa
+import pyarrow.ipc
+import cProfile
+import functools
+import hashlib
+import html
+import importlib
+import itertools
+import json
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class LazyModule:
+    """属性に最初にアクセスした時にimportするモジュールの代理
+
+    描画ライブラリ (Plotly・Altair・Matplotlib・Seaborn) はそれを使う画面を最初に表示するまで読み込まず、
+    ワーカーの起動とHOME画面の初回表示を速くする。読み込んだモジュールは sys.modules に残るので2回目以降は速い。
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __getattr__(self, attribute):
+        return getattr(importlib.import_module(self._name), attribute)
+
+    def __repr__(self):
+        return f'<LazyModule {self._name}>'
+
+
+px = LazyModule('plotly.express')
+go = LazyModule('plotly.graph_objects')
+alt = LazyModule('altair')
+plt = LazyModule('matplotlib.pyplot')
+sns = LazyModule('seaborn')
+
+# --- 計測: 再実行ごとの処理時間・キャッシュのヒット/ミス・出力サイズ ---
+# 計測結果は1レコード1行のJSONとして perf_logger (INFOレベル) に出力する。レベルや出力先は通常のログ設定で変えられる
+PERF_LOG_ENABLED = os.environ.get('JLEAGUE_PERF_LOG', '1') != '0'  # 0 にすると既定の出力先 (標準エラー) を付けない
+PROFILE_DIR = os.environ.get('JLEAGUE_PROFILE_DIR', 'profiles')
+_perf_local = threading.local()
+perf_logger = logging.getLogger(f'{__name__}.perf')
+if PERF_LOG_ENABLED and not perf_logger.handlers:
+    # スクリプトは再実行のたびに実行されるため、ハンドラは最初の1度だけ付ける
+    _perf_handler = logging.StreamHandler()
+    _perf_handler.setFormatter(logging.Formatter('%(message)s'))
+    perf_logger.addHandler(_perf_handler)
+    perf_logger.setLevel(logging.INFO)
+    perf_logger.propagate = False
+
+
+def payload_size(value):
+    """出力のおおよそのサイズ (バイト)。サイズを持たない値は None"""
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True).sum())
+    if isinstance(value, tuple):
+        sizes = [size for size in map(payload_size, value) if size is not None]
+        return sum(sizes) if sizes else None
+    if isinstance(value, dict):
+        # グラフのspec: ブラウザへ送るJSONの長さ
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'))
+    return None
+
+
+def _current_perf_record():
+    stack = getattr(_perf_local, 'stack', None)
+    return stack[-1] if stack else None
+
+
+def mark_cache_miss():
+    """キャッシュされた関数の本体から呼び、実行中の計測をキャッシュミスとして記録する"""
+    record = _current_perf_record()
+    if record is not None:
+        record['cache'] = 'miss'
+
+
+def note_payload(value):
+    """戻り値以外の出力 (描画した画像など) のサイズを実行中の計測に記録する"""
+    record = _current_perf_record()
+    if record is not None:
+        record['bytes'] = payload_size(value)
+
+
+def _record_perf(record: dict):
+    # スクリプトの実行コンテキスト外 (事前計算・ベンチマーク・バックグラウンドのスレッド) では構造化ログにだけ出力する
+    if get_script_run_ctx(suppress_warning=True) is not None:
+        record['run'] = st.session_state.get('perf_run_id', 0)
+        st.session_state.setdefault('perf_records', []).append(record)
+    if perf_logger.isEnabledFor(logging.INFO):
+        perf_logger.info(json.dumps({'event': 'perf', **record}, ensure_ascii=False))
+
+
+def log_perf(stage: str, **fields):
+    """デコレータで囲めない区間 (タブの描画など) の計測値を、instrumented と同じ計測結果・構造化ログに記録する"""
+    _record_perf({'stage': stage, 'cache': None, 'bytes': None, **fields})
+
+
+def instrumented(cached: bool = False):
+    """処理時間・キャッシュのヒット/ミス・出力サイズを記録するデコレータ
+
+    cached=True の場合はヒット扱いで計測を始め、関数本体が mark_cache_miss() を呼んだ時だけミスとする。
+    st.cache_* の外側に付けること。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # Streamlitの実行コンテキスト外 (ベンチマーク等) では計測しない
+            if get_script_run_ctx(suppress_warning=True) is None:
+                return func(*args, **kwargs)
+            record = {'stage': func.__name__, 'cache': 'hit' if cached else None, 'bytes': None}
+            stack = _perf_local.__dict__.setdefault('stack', [])
+            stack.append(record)
+            result = None
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+                return result
+            finally:
+                record['ms'] = round((time.perf_counter() - start) * 1000, 3)
+                stack.pop()
+                # サイズの計測 (specはJSON化する) はヒットのたびには行わず、ミスかデバッグパネルの表示中だけ
+                measure_size = record['cache'] != 'hit' or st.session_state.get('perf_debug', False)
+                if record['bytes'] is None and result is not None and measure_size:
+                    record['bytes'] = payload_size(result)
+                _record_perf(record)
+        if hasattr(func, 'clear'):
+            wrapper.clear = func.clear
+        return wrapper
+    return decorator
+
+
+def begin_perf_run(kind: str):
+    """再実行 (全体またはフラグメント) ごとに計測結果をリセットする
+
+    結果は再実行の種類ごとに保持し、フラグメントの再実行で直前の全体再実行の結果を消さない。
+    """
+    run_id = st.session_state.get('perf_run_id', 0) + 1
+    st.session_state['perf_run_id'] = run_id
+    st.session_state['perf_records'] = records = []
+    st.session_state['perf_run_kind'] = kind
+    st.session_state.setdefault('perf_runs', {})[kind] = {'run_id': run_id, 'records': records}
+
+
+def _request_profile():
+    st.session_state['perf_profile_next'] = True
+
+
+def run_profiled(func):
+    """func を cProfile 付きで実行し、.prof ファイルと上位の集計をセッションに保存する
+
+    ワーカースレッド (HOMEの並列ロード) の処理は含まれない。
+    """
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(func)
+    finally:
+        stream = StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(30)
+        path = os.path.join(PROFILE_DIR, f'rerun_{time.strftime("%Y%m%d_%H%M%S")}.prof')
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profiler.dump_stats(path)
+        except OSError:
+            path = None
+        st.session_state['perf_profile'] = {'path': path, 'summary': stream.getvalue()}
+
+
+def render_perf_records(records: list):
+    if records:
+        table = pd.DataFrame(records, columns=['stage', 'ms', 'cache', 'bytes']).astype({'bytes': 'Int64'})
+        st.dataframe(table, hide_index=True, use_container_width=True)
+
 
-import matplotlib.pyplot as plt
-import seaborn as sns
-from mplsoccer import Pitch, VerticalPitch
-from io import BytesIO
+def render_perf_panel(rerun_ms: float):
+    """サイドバーのデバッグパネル (チェックした時だけ表示する)
+
+    サイドバーは全体の再実行でだけ描画されるため、全体の再実行の結果を表示する。
+    タブ内の操作 (フラグメントの再実行) の結果はそのタブ内に表示する (render_league_tab)。
+    """
+    st.divider()
+    if not st.checkbox('🛠 パフォーマンス計測', key='perf_debug'):
+        return
+    full_run = st.session_state.get('perf_runs', {}).get('full', {})
+    st.caption(f"全体の再実行 #{full_run.get('run_id', 0)}: {rerun_ms:.1f} ms")
+    render_perf_records(full_run.get('records', []))
+    cache = get_result_cache()
+    st.caption(f"結果キャッシュ: {cache.nbytes / 1024 ** 2:.1f} / {cache.max_bytes / 1024 ** 2:.0f} MB")
+    st.dataframe(cache.stats(), use_container_width=True)
+    st.button('次の再実行をプロファイル (cProfile)', on_click=_request_profile, key='perf_profile_button')
+    profile = st.session_state.get('perf_profile')
+    if profile:
+        st.caption(f"保存先: {profile['path']}" if profile['path'] else "プロファイルを保存できませんでした")
+        st.code(profile['summary'], language=None)
+# --- 計測 終了 ---
+
+
+# --- バイト予算つきの結果キャッシュ ---
+# 画像・xlsx・ビューモデル等の計算結果をプロセス内で1つのLRUにまとめ、メモリ使用量の合計で上限をかける
+CACHE_BUDGET_BYTES = int(float(os.environ.get('JLEAGUE_CACHE_BUDGET_MB', '128')) * 1024 ** 2)
+CACHE_MAX_ENTRIES = int(os.environ.get('JLEAGUE_CACHE_MAX_ENTRIES', '1024'))
+
+
+def entry_nbytes(value) -> int:
+    """キャッシュ項目のメモリ使用量 (フレームは文字列を含むdeepな値、画像/xlsxはバイト長)"""
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(index=True, deep=True)
+        return int(usage.sum() if isinstance(value, pd.DataFrame) else usage)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(entry_nbytes(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(entry_nbytes(k) + entry_nbytes(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+
+class LRUBytesCache:
+    """メモリ使用量の合計 (バイト) と件数に上限がある、スレッドセーフなLRUキャッシュ
+
+    キーがタプルの場合は先頭要素を名前空間として、名前空間ごとにヒット/ミス/削除の回数を数える。
+    """
+
+    def __init__(self, max_bytes: int, max_entries: int = None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.nbytes = 0
+        self._entries = OrderedDict()  # key -> (value, nbytes)
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _namespace(key):
+        return key[0] if isinstance(key, tuple) and key else None
+
+    def _count(self, key, counter: str):
+        counters = self._counters.setdefault(self._namespace(key), {'hits': 0, 'misses': 0, 'evictions': 0})
+        counters[counter] += 1
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._count(key, 'misses')
+                return default
+            self._entries.move_to_end(key)
+            self._count(key, 'hits')
+            return entry[0]
+
+    def put(self, key, value, nbytes: int = None):
+        nbytes = entry_nbytes(value) if nbytes is None else nbytes
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous[1]
+            # 予算より大きい項目は保持しない (他の項目を全て追い出してしまうため)
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (value, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes or (self.max_entries and len(self._entries) > self.max_entries):
+                evicted_key, (_, evicted_nbytes) = self._entries.popitem(last=False)
+                self.nbytes -= evicted_nbytes
+                self._count(evicted_key, 'evictions')
+
+    def stats(self) -> pd.DataFrame:
+        """名前空間ごとの件数・メモリ使用量・ヒット/ミス/削除の回数"""
+        with self._lock:
+            rows = {namespace: {'entries': 0, 'bytes': 0, **counters} for namespace, counters in self._counters.items()}
+            for key, (_, nbytes) in self._entries.items():
+                row = rows.setdefault(self._namespace(key), {'entries': 0, 'bytes': 0, 'hits': 0, 'misses': 0, 'evictions': 0})
+                row['entries'] += 1
+                row['bytes'] += nbytes
+        return pd.DataFrame.from_dict(rows, orient='index').rename_axis('cache')
+
+
+@st.cache_resource(show_spinner=False)
+def get_result_cache() -> LRUBytesCache:
+    # セッション間で共有する (スクリプト再実行のたびに作り直されないよう cache_resource で保持)
+    return LRUBytesCache(CACHE_BUDGET_BYTES, CACHE_MAX_ENTRIES)
+
+
+_CACHE_MISSING = object()
+
+
+def budget_cached(namespace: str):
+    """関数の結果を共有の結果キャッシュ (バイト予算つきLRU) に保存するデコレータ。引数はハッシュ可能であること
+
+    st.cache_data と違い呼び出しごとに複製しないため、戻り値を書き換えないこと。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            cache = get_result_cache()
+            key = (namespace, *args)
+            value = cache.get(key, _CACHE_MISSING)
+            if value is _CACHE_MISSING:
+                value = func(*args)
+                cache.put(key, value)
+            return value
+        return wrapper
+    return decorator
+# --- 結果キャッシュ 終了 ---
 
-# --- 0. グローバル設定 ---
-st.set_page_config(layout="wide")
-st.subheader('All data by SkillCorner')
 
 # --- Excel出力用の関数 ---
+@instrumented()
 def to_excel(df: pd.DataFrame):
     """データフレームをExcelバイトストリームに変換する"""
     output = BytesIO()
@@ -40,63 +344,424 @@ LEAGUE_COLOR_MAP = {
     'J2': '#127A3A', # 緑
     'J3': '#014099', # 青
 }
-@st.cache_data(ttl=60*15)
-def get_data(league_key):
-    file_name = LEAGUE_FILE_MAP.get(league_key, LEAGUE_FILE_MAP['J1'])
-    file_path = f"data/{file_name}"
+# --- 列指向キャッシュ (Feather) の設定 ---
+# 前処理済み (League/Matchday 計算済み) のフレームを保存し、元CSVの更新時刻またはハッシュが変わった時のみ再構築する
+# キャッシュは非圧縮のArrow IPCファイルで、全ワーカープロセスがメモリマップで共有する読み取り専用のストアを兼ねる
+DATA_DIR = 'data'
+CACHE_DIR = os.path.join(DATA_DIR, '.cache')
+CACHE_FORMAT_VERSION = 4  # 前処理ロジックやファイル形式を変更したら上げる (既存キャッシュを無効化)
+
+# --- シーズン × リーグのパーティション ---
+# data/{シーズン}_{リーグ}_physical_data.csv を1パーティションとし、表示に必要なパーティションだけを読み込む
+PARTITION_PATTERN = re.compile(r'^(\d{4})_(.+)_physical_data\.csv$')
+
+
+def match_league_file(league_key: str, file_name: str) -> re.Match:
+    """LEAGUE_FILE_MAP の項目を (シーズン, リーグのタグ) に分解する。形式が違えば項目を示して ValueError"""
+    match = PARTITION_PATTERN.match(file_name)
+    if match is None:
+        raise ValueError(f"LEAGUE_FILE_MAP['{league_key}'] = '{file_name}' は "
+                         "'{シーズン}_{リーグ}_physical_data.csv' の形式ではありません")
+    return match
+
+
+LEAGUE_PARTITION_TAGS = {league_key: match_league_file(league_key, file_name).group(2) for league_key, file_name in LEAGUE_FILE_MAP.items()}
+DEFAULT_SEASON = max(int(match_league_file(league_key, file_name).group(1)) for league_key, file_name in LEAGUE_FILE_MAP.items())
+
+
+def partition_file_name(league_key: str, season: int) -> str:
+    return f'{season}_{LEAGUE_PARTITION_TAGS[league_key]}_physical_data.csv'
+
+
+def partition_signature(league_key: str, season: int):
+    """パーティションの元CSVの (更新時刻, サイズ)。ファイルがなければ None"""
     try:
-        # ローディングインジケータを表示 (Streamlit Cloudで役立つ)
-        with st.spinner(f'{league_key}データをロード中...'):
-            df = pd.read_csv(file_path)
-            # リーグ情報を追加
-            df['League'] = league_key
-
-            # Match ID と Match Date を使用して Matchday (節) を計算
-            if 'Match Date' in df.columns and 'Match ID' in df.columns and not df['Match Date'].isnull().all():
-                
-                # Match Dateを日付型に変換（エラーが出たら無視）
-                df['Match Date'] = pd.to_datetime(df['Match Date'], errors='coerce')
-                
-                # 1. ユニークな試合の特定 (Match IDをキーに使用)
-                unique_matches = df[['Team', 'Match ID', 'Match Date']].drop_duplicates()
-                
-                # 2. Match Dateでソート
-                unique_matches = unique_matches.sort_values(by=['Team', 'Match Date']).reset_index(drop=True)
-                
-                # 3. チームごとに節番号 (Matchday) を付与
-                unique_matches['Matchday'] = unique_matches.groupby('Team').cumcount() + 1
-                
-                # 4. 節番号を元のデータフレームにマージ (TeamとMatch IDをキーに)
-                df = pd.merge(df, unique_matches[['Team', 'Match ID', 'Matchday']], on=['Team', 'Match ID'], how='left')
-                
-                # 'Matchday' が NaN になる行がある可能性（データの欠損/不整合）を考慮し、NaNは削除/無視
-                df = df.dropna(subset=['Matchday'])
-                df['Matchday'] = df['Matchday'].astype(int)
-                
-            # フォールバックロジック (Match Date/Match IDがない場合)
-            elif 'Matchday' not in df.columns:
-                 df['Matchday'] = df.groupby('Team').cumcount() + 1
-                 st.warning(f"⚠️ {league_key}データに正確な時系列情報がなく、節 ('Matchday') の生成が不正確になる可能性があります。")
-                
-            return df
-    except Exception as e:
-        st.error(f"{league_key} データ ({file_name}) のロードに失敗しました。ファイルが存在するか確認してください。")
-        return pd.DataFrame()
+        stat = os.stat(os.path.join(DATA_DIR, partition_file_name(league_key, season)))
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
 
-# 全リーグデータを結合する関数 (HOME画面用)
-@st.cache_data(ttl=60*15)
-def get_all_league_data():
-    all_dfs = []
-    for league_key in LEAGUE_FILE_MAP.keys():
-        df = get_data(league_key)
-        if not df.empty:
-            all_dfs.append(df)
-    
-    if not all_dfs:
-        return pd.DataFrame()
+
+def scan_data_catalog() -> dict:
+    """data/ のCSVを走査し、{シーズン: [リーグ, ...]} のカタログを新しいシーズン順に返す
+
+    ストアを参照するたびに呼ばれるため、フォルダの更新時刻 (ファイルの追加・削除で変わる) が変わった時だけ走査し直す。
+    共有の結果なので書き換えないこと。
+    """
+    try:
+        mtime_ns = os.stat(DATA_DIR).st_mtime_ns
+    except OSError:
+        mtime_ns = None
+    return _scan_data_catalog(os.path.abspath(DATA_DIR), mtime_ns)
+
+
+# st.cache_resource の呼び出しはフォルダの走査より重いため、軽い lru_cache で持つ (スクリプトの再実行ごとに作り直される)
+@functools.lru_cache(maxsize=4)
+def _scan_data_catalog(data_dir: str, mtime_ns) -> dict:
+    tag_to_league = {tag: league_key for league_key, tag in LEAGUE_PARTITION_TAGS.items()}
+    try:
+        file_names = os.listdir(data_dir)
+    except OSError:
+        file_names = []
+    catalog = {}
+    for file_name in file_names:
+        match = PARTITION_PATTERN.match(file_name)
+        if match and match.group(2) in tag_to_league:
+            catalog.setdefault(int(match.group(1)), set()).add(tag_to_league[match.group(2)])
+    return {season: [league_key for league_key in LEAGUE_FILE_MAP if league_key in catalog[season]] for season in sorted(catalog, reverse=True)}
+
+
+def available_seasons() -> list:
+    """選択できるシーズン (データがなければ LEAGUE_FILE_MAP のシーズン)"""
+    return list(scan_data_catalog()) or [DEFAULT_SEASON]
+
+
+def _file_sha256(file_path: str) -> str:
+    """ファイル内容のSHA-256ハッシュを計算する"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _has_match_timeline(df: pd.DataFrame) -> bool:
+    """Match ID と Match Date から節を計算できるかどうか"""
+    return 'Match Date' in df.columns and 'Match ID' in df.columns and not df['Match Date'].isnull().all()
+
+
+# メモリ削減のための列型定義 (ロード時に適用)
+CATEGORICAL_COLUMNS = ['Team', 'League', 'Match ID']
+MATCHDAY_DTYPE = 'int16'
+METRIC_DTYPE = 'float32'
+METRIC_RTOL = 1e-6  # float32 へ変換しても許容できる相対誤差
+TEXT_CATEGORY_MAX_RATIO = 0.5  # ユニーク数が行数のこの割合以下の文字列列 (選手名・ポジション等) もカテゴリ型にする
+
+
+def frame_memory_mb(df: pd.DataFrame) -> float:
+    """データフレームの実メモリ使用量 (文字列を含む) をMB単位で返す"""
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+
+def apply_league_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """チーム/リーグ/試合IDをカテゴリ型、指標をfloat32、節を小さい整数型に変換する"""
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+
+    # 繰り返しの多い文字列列はカテゴリ型 (コード配列) にする。共有ストアからもコピーせずに参照できる
+    for column in df.columns:
+        is_text = df[column].dtype == object or isinstance(df[column].dtype, pd.StringDtype)
+        if is_text and df[column].nunique() <= TEXT_CATEGORY_MAX_RATIO * len(df):
+            df[column] = df[column].astype('category')
+
+    for column in available_vars:
+        if column in df.columns and pd.api.types.is_float_dtype(df[column]) and df[column].dtype != METRIC_DTYPE:
+            downcast = df[column].astype(METRIC_DTYPE)
+            # 精度が保てる場合のみ変換 (極端に大きい値を含む列はfloat64のまま)
+            if np.allclose(downcast.to_numpy(dtype='float64'), df[column].to_numpy(), rtol=METRIC_RTOL, equal_nan=True):
+                df[column] = downcast
+
+    if 'Matchday' in df.columns:
+        df['Matchday'] = df['Matchday'].astype(MATCHDAY_DTYPE)
+    return df
+
+
+def derive_matchday(df: pd.DataFrame) -> np.ndarray:
+    """Team と Match ID の因子化コードから、チームごとの試合の通し番号 (節) を行単位で返す
+
+    ユニークな (Team, Match ID) だけを (Team, Match Date) で1回ソートし、節番号を行へインデックスで書き戻す。
+    Match Date が欠損 (NaT) の試合はチーム内で最後に数える。Team/Match ID が欠損している行は 0 を返す。
+    """
+    team_codes, _ = pd.factorize(df['Team'])
+    match_codes, match_uniques = pd.factorize(df['Match ID'])
+    valid = (team_codes >= 0) & (match_codes >= 0)
+    positions = np.flatnonzero(valid)
+    pair_codes, pair_uniques = pd.factorize(team_codes[positions].astype(np.int64) * max(len(match_uniques), 1) + match_codes[positions])
+    n_pairs = len(pair_uniques)
+
+    # 各 (Team, Match ID) の最初の行を代表行とする (逆順に書き込むと先頭の行番号が残る)
+    first_row = np.empty(n_pairs, dtype=np.int64)
+    first_row[pair_codes[::-1]] = positions[::-1]
+
+    dates = df['Match Date'].to_numpy(dtype='datetime64[ns]').view(np.int64)[first_row]
+    dates = np.where(dates == np.iinfo(np.int64).min, np.iinfo(np.int64).max, dates)  # NaTを末尾へ
+    pair_teams = team_codes[first_row]
+
+    # 安定ソートなので同日の試合はCSVでの出現順になる
+    order = np.lexsort((dates, pair_teams))
+    sorted_teams = pair_teams[order]
+    new_team = np.ones(n_pairs, dtype=bool)
+    new_team[1:] = sorted_teams[1:] != sorted_teams[:-1]
+
+    # 全体の通し番号から各チームの先頭位置を引いてチーム内の節番号にする
+    ordinal = np.arange(n_pairs)
+    pair_matchday = np.empty(n_pairs, dtype=np.int64)
+    pair_matchday[order] = ordinal - ordinal[new_team][np.cumsum(new_team) - 1] + 1
+
+    matchday = np.zeros(len(df), dtype=np.int64)
+    matchday[positions] = pair_matchday[pair_codes]
+    return matchday
+
+
+def prepare_league_frame(df: pd.DataFrame, league_key: str) -> pd.DataFrame:
+    """読み込んだCSVにリーグ情報と節 (Matchday) を付与する"""
+    # リーグ情報を追加
+    df['League'] = league_key
+
+    # Match ID と Match Date を使用して Matchday (節) を計算
+    if _has_match_timeline(df):
+        
+        # Match Dateを日付型に変換（エラーが出たら無視）
+        df['Match Date'] = pd.to_datetime(df['Match Date'], errors='coerce')
         
-    combined_df = pd.concat(all_dfs, ignore_index=True)
-    return combined_df
+        # チーム×試合ごとの節番号を計算し、行インデックスにそのまま書き戻す (merge不要)
+        matchday = derive_matchday(df)
+        
+        # Team/Match ID が欠損している行 (データの欠損/不整合) は節を付与できないため削除/無視
+        valid = matchday > 0
+        if not valid.all():
+            df = df.loc[valid]
+            matchday = matchday[valid]
+        df['Matchday'] = matchday
+        
+    # フォールバックロジック (Match Date/Match IDがない場合)
+    elif 'Matchday' not in df.columns:
+         df['Matchday'] = df.groupby('Team').cumcount() + 1
+
+    memory_before = frame_memory_mb(df)
+    df = apply_league_schema(df)
+    log_perf(f'prepare_league_frame:{league_key}', rows=len(df), memory_before_mb=round(memory_before, 3),
+             memory_mb=round(frame_memory_mb(df), 3))
+    return df
+
+
+def _write_cache_meta(meta_path: str, meta: dict):
+    tmp_path = f'{meta_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+
+def _partition_cache_paths(file_name: str) -> tuple:
+    """パーティションの (Featherキャッシュ, メタ情報, 集計の構成要素キャッシュ) のパス"""
+    stem = os.path.splitext(file_name)[0]
+    return (os.path.join(CACHE_DIR, f'{stem}.feather'), os.path.join(CACHE_DIR, f'{stem}.json'),
+            os.path.join(CACHE_DIR, f'{stem}.components.feather'))
+
+
+def _partition_cache_state(league_key: str, file_name: str) -> tuple:
+    """(キャッシュが元CSVと一致するか, メタ情報) を返す。一致しない場合は再構築後に書き込むメタ情報を返す"""
+    file_path = os.path.join(DATA_DIR, file_name)
+    cache_path, meta_path, _ = _partition_cache_paths(file_name)
+
+    stat = os.stat(file_path)
+    meta = {}
+    if os.path.exists(cache_path) and os.path.exists(meta_path):
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+
+    if meta.get('format_version') == CACHE_FORMAT_VERSION and meta.get('league') == league_key:
+        # 1. 更新時刻とサイズが一致すればハッシュ計算も不要
+        if meta.get('mtime_ns') == stat.st_mtime_ns and meta.get('size') == stat.st_size:
+            return True, meta
+        # 2. 更新時刻だけ変わった (コピー/チェックアウト等) 場合は内容ハッシュで判定
+        sha256 = _file_sha256(file_path)
+        if meta.get('sha256') == sha256:
+            meta.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+            _write_cache_meta(meta_path, meta)
+            return True, meta
+    else:
+        sha256 = _file_sha256(file_path)
+
+    return False, {
+        'format_version': CACHE_FORMAT_VERSION,
+        'league': league_key,
+        'source': file_name,
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha256': sha256,
+    }
+
+
+def _write_feather_atomic(df: pd.DataFrame, path: str):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    # 圧縮するとメモリマップから直接参照できず、複数のバッチに分かれると読み込み時に結合 (コピー) が必要になるため、
+    # 非圧縮の1バッチで書く
+    df.to_feather(tmp_path, compression='uncompressed', chunksize=max(len(df), 1))
+    os.replace(tmp_path, path)  # 他プロセスが書き込み途中のファイルを読まないよう置き換えで公開
+
+
+def attach_shared_frame(path: str) -> pd.DataFrame:
+    """共有ストアのArrow IPCファイルをメモリマップで開き、列をコピーせずに参照するDataFrameを返す
+
+    ページはOSのページキャッシュとして全ワーカーで共有されるため、ワーカーを増やしてもデータ分のメモリは増えない。
+    配列は読み取り専用 (書き込む操作ではpandasのCopy-on-Writeでその列だけコピーされる)。
+    """
+    table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    # split_blocks=True で列ごとのブロックにし、pandasのブロック統合によるコピーを避ける
+    return table.to_pandas(split_blocks=True)
+
+
+def _flatten_components(components: pd.DataFrame) -> pd.DataFrame:
+    # Featherは列のMultiIndexを保存できないため '構成要素|指標' の列名に平坦化する
+    flat = components.copy()
+    flat.columns = [f'{component}|{metric}' for component, metric in components.columns]
+    return flat.reset_index()
+
+
+def _unflatten_components(flat: pd.DataFrame) -> pd.DataFrame:
+    components = flat.set_index('Team')
+    components.columns = pd.MultiIndex.from_tuples([tuple(column.split('|', 1)) for column in components.columns])
+    return components
+
+
+def load_league_frame(league_key: str, season: int = None) -> pd.DataFrame:
+    """前処理済みのパーティション (シーズン × リーグ) を返す。列指向キャッシュが有効ならCSVの再パースを省略する"""
+    file_name = partition_file_name(league_key, season or DEFAULT_SEASON)
+    cache_path, meta_path, components_path = _partition_cache_paths(file_name)
+    is_fresh, meta = _partition_cache_state(league_key, file_name)
+    if is_fresh:
+        return attach_shared_frame(cache_path)
+
+    # キャッシュが無効: CSVを読み込み前処理し、フレームと集計の構成要素を共有ストアに公開する
+    df = prepare_league_frame(pd.read_csv(os.path.join(DATA_DIR, file_name)), league_key)
+    try:
+        _write_feather_atomic(df.reset_index(drop=True), cache_path)
+        _write_feather_atomic(_flatten_components(aggregate_components(df)), components_path)
+        meta['components_sha256'] = meta['sha256']
+        _write_cache_meta(meta_path, meta)
+    except OSError:
+        # 読み取り専用環境などでキャッシュを書けなくても、データ自体は返す
+        return df
+    # 作ったフレームは手放し、このプロセスも他のワーカーと同じメモリマップを参照する
+    return attach_shared_frame(cache_path)
+
+
+def read_published_components(league_key: str, season: int):
+    """共有ストアに公開済みの集計の構成要素を返す。元CSVと一致するものがなければ None"""
+    file_name = partition_file_name(league_key, season)
+    _, _, components_path = _partition_cache_paths(file_name)
+    is_fresh, meta = _partition_cache_state(league_key, file_name)
+    if is_fresh and meta.get('components_sha256') == meta['sha256'] and os.path.exists(components_path):
+        return _unflatten_components(attach_shared_frame(components_path))
+    return None
+
+
+def load_partition_components(league_key: str, season: int) -> pd.DataFrame:
+    """パーティションの集計の構成要素を返す。キャッシュが有効なら行データを読み込まない"""
+    components = read_published_components(league_key, season)
+    if components is not None:
+        return components
+
+    file_name = partition_file_name(league_key, season)
+    _, meta_path, components_path = _partition_cache_paths(file_name)
+    components = aggregate_components(load_league_frame(league_key, season))
+    try:
+        _write_feather_atomic(_flatten_components(components), components_path)
+        is_fresh, meta = _partition_cache_state(league_key, file_name)
+        if is_fresh:
+            meta['components_sha256'] = meta['sha256']
+            _write_cache_meta(meta_path, meta)
+    except OSError:
+        pass
+    return components
+
+
+# 保持するパーティションの上限 (シーズンが増えてもワーカーのメモリが増え続けないようにする)
+PARTITION_CACHE_ENTRIES = 2 * len(LEAGUE_FILE_MAP)
+# 元CSVの更新を確認する間隔 (秒)。更新があればバックグラウンドで再読み込みする (期限切れのTTLは使わない)
+SOURCE_CHECK_INTERVAL = float(os.environ.get('JLEAGUE_SOURCE_CHECK_INTERVAL', '5'))
+
+
+# st.cache_data は呼び出しのたびにフレームを複製するため、共有ストアを参照するフレームをそのまま返す cache_resource を使う
+@instrumented(cached=True)
+# show_spinner=False: 並列ロードのワーカースレッドからも呼ぶため、スピナーは呼び出し側がスクリプトのスレッドで出す
+@st.cache_resource(max_entries=PARTITION_CACHE_ENTRIES, show_spinner=False)
+def get_data(league_key, season=DEFAULT_SEASON, source_signature=None):
+    # source_signature (元CSVの更新時刻とサイズ) はキャッシュキーとしてだけ使い、ファイルが変われば読み直す
+    # キャッシュした関数内で st.warning 等を呼ぶとキャッシュヒットのたびに再表示されるため、UIは呼ばない。
+    # ロードの失敗は例外のまま返し、ストア (load_error / matchday_generated) を通して描画側で1度だけ表示する
+    mark_cache_miss()
+    return load_league_frame(league_key, season)
+
+
+def matchday_was_generated(df: pd.DataFrame, league_key: str, season: int) -> bool:
+    """時系列情報 (Match Date/Match ID) がなく、元CSVにも節がないため、節を行の順番から生成したかどうか"""
+    if df.empty or _has_match_timeline(df):
+        return False
+    try:
+        return 'Matchday' not in pd.read_csv(os.path.join(DATA_DIR, partition_file_name(league_key, season)), nrows=0).columns
+    except (OSError, ValueError):
+        return False
+
+
+def concat_league_frames(frames: list) -> pd.DataFrame:
+    """カテゴリ集合を揃えてからフレームを結合する (カテゴリが異なるとconcatでobject型に戻るため)"""
+    for column in CATEGORICAL_COLUMNS:
+        columns = [frame[column] for frame in frames if column in frame.columns]
+        if len(columns) == len(frames) and all(isinstance(c.dtype, pd.CategoricalDtype) for c in columns):
+            categories = union_categoricals(columns).categories
+            frames = [frame.assign(**{column: frame[column].cat.set_categories(categories)}) for frame in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def _load_league_store_timed(league_key, season):
+    # ワーカースレッドではデータのロードだけを行う。スクリプト実行コンテキストは引き継がないため、
+    # st.cache_resource のスピナー等のUIも出ない (同じセッションへ複数スレッドから描画するとメッセージが混ざる)
+    start = time.perf_counter()
+    store = get_league_store(league_key, season)
+    return store, time.perf_counter() - start
+
+
+def load_all_league_stores(season=DEFAULT_SEASON) -> dict:
+    """シーズンの全リーグのストアを返す。未ロードのリーグがあれば並列にロードし、リーグごとと合計のロード時間を記録する"""
+    league_keys = scan_data_catalog().get(season, list(LEAGUE_FILE_MAP))
+    loaded = _loaded_store_keys()
+    if all((league_key, season) in loaded for league_key in league_keys):
+        # 全てロード済み (再実行のたびに通る): スレッドを作らずキャッシュから返す
+        return {league_key: get_league_store(league_key, season) for league_key in league_keys}
+
+    start = time.perf_counter()
+    # CSVパース/Feather読み込みはGILを解放するため、スレッドで並列化できる (フレームをプロセス間で受け渡すコストも不要)
+    # スピナーとロード結果の表示 (render_store_notices) はスクリプトのスレッドから行う
+    with st.spinner(f'{season} 全リーグのデータをロード中...'), ThreadPoolExecutor(max_workers=max(len(league_keys), 1)) as executor:
+        futures = {league_key: executor.submit(_load_league_store_timed, league_key, season) for league_key in league_keys}
+        results = {league_key: future.result() for league_key, future in futures.items()}
+    stores = {}
+    for league_key, (store, elapsed) in results.items():
+        log_perf(f'load_store:{league_key}', ms=round(elapsed * 1000, 3))
+        stores[league_key] = store
+    log_perf('load_all_league_stores', ms=round((time.perf_counter() - start) * 1000, 3))
+    return stores
+
+
+def league_store_versions(stores: dict) -> tuple:
+    """((リーグ, ストアのバージョン), ...)。追記された節も反映されるよう、全リーグを使う結果のキャッシュキーにする"""
+    return tuple((league_key, store.version) for league_key, store in stores.items())
+
+
+# 全リーグのチーム別平均 (HOME画面用)
+@instrumented(cached=True)
+@budget_cached('league_overview')
+def get_league_overview(season, versions) -> pd.DataFrame:
+    """Team・League × 指標の平均値 (各リーグの集計キューブから作るため、全リーグの行データを結合しない)"""
+    mark_cache_miss()
+    return build_league_overview({league_key: get_league_store(league_key, season).cube() for league_key, _ in versions})
+
+
+def build_league_overview(cubes: dict) -> pd.DataFrame:
+    """リーグごとの集計キューブ {リーグ: キューブ} から Team・League × 指標の平均値の表を作る"""
+    overviews = [cube['Average'].reset_index().assign(League=league_key) for league_key, cube in cubes.items() if not cube.empty]
+    if not overviews:
+        return pd.DataFrame()
+    overview = pd.concat(overviews, ignore_index=True)
+    return overview[['Team', 'League', *[v for v in available_vars if v in overview.columns]]]
+
 
 # 📌 チームカラー定義 (グローバルに配置)
 TEAM_COLORS = {
@@ -125,39 +790,691 @@ available_vars = ['Distance','Running Distance','M/min','HSR Distance','Sprint C
                   'Sprint Distance TIP','Sprint Count TIP','Distance OTIP','Running Distance OTIP','HSR Distance OTIP','HSR Count OTIP',
                   'Sprint Distance OTIP','Sprint Count OTIP'] # TIP/OTIP指標を追加
 RANKING_METHODS = ['Total', 'Average', 'Max', 'Min'] # 集計方法の定義
+RANKING_AGG_FUNCS = {'Total': 'sum', 'Average': 'mean', 'Max': 'max', 'Min': 'min'} # 集計方法 -> pandasの集計関数
 
 
-# --- 2. 描画ロジック関数 (共通関数) ---
+AGGREGATE_COMPONENTS = ['sum', 'count', 'max', 'min'] # 集計キューブを組み立てるための構成要素 (追記で更新可能)
 
-def render_custom_ranking(df: pd.DataFrame, league_name: str, team_colors: dict, available_vars: list):
-    """カスタムランキング（Matplotlib）を描画する"""
-    st.markdown("### 🏆 カスタムランキング作成")
-    
-    # UI要素の定義: keyをリーグごとにユニークにし、セッションステートの衝突を防ぐ
-    team = st.selectbox('注目チームを選択', df['Team'].unique(), key=f"focal_team_{league_name}") 
-    focal_color = team_colors.get(team, '#000000') 
 
-    col1, col2 = st.columns(2)
-    with col1:
-        rank_method = st.selectbox('集計方法 (Ranking Method)', RANKING_METHODS, key=f"rank_method_{league_name}") 
-    with col2:
-        rank_var = st.selectbox('評価指標 (Metric to Rank)', available_vars, key=f"rank_var_{league_name}") 
-    
-    ranking_base_df = df.copy()
-
-    # データの集計ロジック
-    if rank_method == 'Total':
-        rank_df = ranking_base_df.groupby(['Team'])[available_vars].sum().reset_index()
-        sort_method = False
-    elif rank_method == 'Average':
-        rank_df = ranking_base_df.groupby(['Team'])[available_vars].mean().reset_index()
-        sort_method = False
-    elif rank_method == 'Max':
-        rank_df = ranking_base_df.groupby(['Team'])[available_vars].max().reset_index()
-        sort_method = False
-    elif rank_method == 'Min':
-        rank_df = ranking_base_df.groupby(['Team'])[available_vars].min().reset_index()
-        sort_method = True 
+def aggregate_components(df: pd.DataFrame) -> pd.DataFrame:
+    """Team × (構成要素, 指標) の合計・件数・最大・最小を1回のグループ化で計算する"""
+    metric_vars = [v for v in available_vars if v in df.columns]
+    grouped = df.groupby('Team', observed=True)[metric_vars]
+    # agg(list) は列×関数ごとに分かれて遅いため、同じグループ化に対して全列一括の集計を4回行う
+    components = pd.concat([getattr(grouped, c)() for c in AGGREGATE_COMPONENTS], axis=1, keys=AGGREGATE_COMPONENTS)
+    # カテゴリのインデックスはリーグ間/バッチ間で揃わないため、通常のチーム名インデックスにする
+    components.index = pd.Index(components.index.tolist(), name='Team')
+    return components
+
+
+def cube_from_components(components: pd.DataFrame) -> pd.DataFrame:
+    """構成要素から Team × (集計方法, 指標) の集計キューブを作成する"""
+    if components.empty:
+        return pd.DataFrame()
+    sums = components['sum']
+    methods = {
+        'Total': sums,
+        'Average': sums / components['count'].where(components['count'] > 0),
+        'Max': components['max'],
+        'Min': components['min'],
+    }
+    return pd.concat([methods[method] for method in RANKING_METHODS], axis=1, keys=RANKING_METHODS, names=['Method', 'Metric'])
+
+
+def build_aggregate_cube(df: pd.DataFrame) -> pd.DataFrame:
+    """Team × (集計方法, 指標) の集計キューブを1回のグループ化で作成する"""
+    return cube_from_components(aggregate_components(df))
+
+
+def merge_components(left: pd.DataFrame, right: pd.DataFrame) -> pd.DataFrame:
+    """2つの構成要素テーブルを合成する (合計・件数は加算、最大・最小は欠損を無視して比較)"""
+    if left.empty:
+        return right
+    if right.empty:
+        return left
+    teams = left.index.union(right.index)
+    left = left.reindex(teams)
+    right = right.reindex(teams)
+    merged = {
+        'sum': left['sum'].fillna(0) + right['sum'].fillna(0),
+        'count': left['count'].fillna(0) + right['count'].fillna(0),
+        'max': np.fmax(left['max'], right['max']),
+        'min': np.fmin(left['min'], right['min']),
+    }
+    return pd.concat([merged[c] for c in AGGREGATE_COMPONENTS], axis=1, keys=AGGREGATE_COMPONENTS)
+
+
+def build_match_table(df: pd.DataFrame) -> pd.DataFrame:
+    """(Team, Match ID) ごとに1行の試合表 (対戦相手・節・各指標の試合平均) を作成する
+
+    インデックスは (Team, Match ID)。対戦相手の値は table.loc[(Opponent, Match ID)] のインデックス参照で引ける。
+    """
+    metric_vars = [v for v in available_vars if v in df.columns]
+    grouped = df.groupby(['Team', 'Match ID'], observed=True)
+    table = grouped[metric_vars].mean()
+    table.insert(0, 'Matchday', grouped['Matchday'].first())
+    table = table.reset_index()
+    table['Team'] = table['Team'].astype(str)
+
+    # Match IDで並べると同じ試合の2チームが隣接する: 先頭行の相手は2行目、それ以外の行の相手は先頭行
+    table = table.sort_values('Match ID', kind='stable').reset_index(drop=True)
+    match_codes = pd.factorize(table['Match ID'])[0]
+    position = np.arange(len(table))
+    is_start = np.ones(len(table), dtype=bool)
+    is_start[1:] = match_codes[1:] != match_codes[:-1]
+    start_of_row = np.maximum.accumulate(np.where(is_start, position, 0))
+    opponent_position = np.minimum(np.where(is_start, position + 1, start_of_row), max(len(table) - 1, 0))
+    has_opponent = np.bincount(match_codes, minlength=1)[match_codes] > 1
+    table.insert(2, 'Opponent', np.where(has_opponent, table['Team'].to_numpy()[opponent_position], None))
+    return table.set_index(['Team', 'Match ID']).sort_index()
+
+
+SEASON_MATCHDAYS = 38  # 節の配列の最小サイズ (J1/J2/J3 の最大節数)
+
+
+class TrendArray:
+    """Team × Matchday × Metric の密な配列 (試合がない節はNaN) と、チーム・指標の位置の対応表
+
+    values[t, md - 1, k] がチーム t の第 md 節の指標 k の試合平均。opponents[t, md - 1] はその試合の対戦相手の位置 (なしは -1)、
+    opponent_matchdays[t, md - 1] は同じ試合の対戦相手側の節 (なしは 0)。節はチームごとの試合数なので、延期試合があると両チームで異なる。
+    """
+
+    def __init__(self, teams: list, metrics: list, values: np.ndarray, opponents: np.ndarray, opponent_matchdays: np.ndarray):
+        self.teams = teams
+        self.metrics = metrics
+        self.team_index = {team: i for i, team in enumerate(teams)}
+        self.metric_index = {metric: k for k, metric in enumerate(metrics)}
+        self.values = values
+        self.opponents = opponents
+        self.opponent_matchdays = opponent_matchdays
+        self.matchdays = np.arange(1, values.shape[1] + 1)
+
+    def series(self, team: str, metric: str) -> np.ndarray:
+        """チームの節ごとの値 (長さは節数、試合がない節はNaN)"""
+        return self.values[self.team_index[team], :, self.metric_index[metric]]
+
+    def opponent_series(self, team: str, metric: str):
+        """自チームの各節の (対戦相手名, 対戦相手の値) (対戦相手がいない節は (None, NaN))"""
+        opponents = self.opponents[self.team_index[team]]
+        opponent_matchdays = self.opponent_matchdays[self.team_index[team]]
+        has_opponent = (opponents >= 0) & (opponent_matchdays > 0)
+        values = np.full(len(opponents), np.nan, dtype=self.values.dtype)
+        values[has_opponent] = self.values[opponents[has_opponent], opponent_matchdays[has_opponent] - 1, self.metric_index[metric]]
+        names = np.array([self.teams[i] if i >= 0 else None for i in opponents], dtype=object)
+        return names, values
+
+    def league_average(self, metric: str) -> np.ndarray:
+        """節ごとのリーグ平均 (その節に試合のあるチームの平均)"""
+        column = self.values[:, :, self.metric_index[metric]]
+        counts = np.sum(~np.isnan(column), axis=0)
+        sums = np.nansum(column, axis=0)
+        return np.divide(sums, counts, out=np.full(len(counts), np.nan, dtype='float64'), where=counts > 0)
+
+
+def build_trend_array(match_table: pd.DataFrame) -> TrendArray:
+    """試合表から Team × Matchday × Metric の密な配列を作成する"""
+    metrics = [v for v in available_vars if v in match_table.columns]
+    table = match_table.reset_index()
+    teams = sorted(table['Team'].unique().tolist())
+    n_matchdays = max(SEASON_MATCHDAYS, int(table['Matchday'].max()) if len(table) else 0)
+
+    team_positions = pd.Index(teams).get_indexer(table['Team'])
+    matchday_positions = table['Matchday'].to_numpy(dtype=np.int64) - 1
+    values = np.full((len(teams), n_matchdays, len(metrics)), np.nan, dtype=np.float32)
+    values[team_positions, matchday_positions] = table[metrics].to_numpy(dtype=np.float32)
+
+    # 対戦相手の位置 (リーグ外のチームや欠損は -1)
+    opponents = np.full((len(teams), n_matchdays), -1, dtype=np.int32)
+    opponents[team_positions, matchday_positions] = pd.Index(teams).get_indexer(table['Opponent'])
+    # 対戦相手側の節: 同じ試合の (Opponent, Match ID) の行から引く (延期試合があると自チームの節とずれる)
+    opponent_rows = match_table.index.get_indexer(pd.MultiIndex.from_arrays([table['Opponent'], table['Match ID']]))
+    opponent_matchdays = np.zeros((len(teams), n_matchdays), dtype=np.int16)
+    opponent_matchdays[team_positions, matchday_positions] = np.where(
+        opponent_rows >= 0, match_table['Matchday'].to_numpy(dtype=np.int64)[opponent_rows], 0)
+    return TrendArray(teams, metrics, values, opponents, opponent_matchdays)
+
+
+# --- 事前計算の成果物 (precompute.py が夜間のデータ更新後に書き出す) ---
+# artifacts/<バージョン>/ に集計表・動向配列・ランキング画像・xlsx・散布図を置き、artifacts/CURRENT に公開中のバージョン名を書く
+ARTIFACT_DIR = os.environ.get('JLEAGUE_ARTIFACT_DIR', 'artifacts')
+ARTIFACT_FORMAT_VERSION = 2  # 成果物の形式を変更したら上げる (古い成果物は使わない)
+ARTIFACT_SCATTER_COLORINGS = ['リーグ', 'チーム別 (デフォルト)'] # 事前計算するHOME散布図の色分け (注目チームはチームの数だけあるため対象外)
+
+
+def artifact_file_name(*parts, ext: str) -> str:
+    """集計方法・指標・チーム名から成果物のファイル名を作る (/ や空白などは _ に置き換える)"""
+    return '__'.join(re.sub(r'[^\w\-]+', '_', str(part)) for part in parts) + f'.{ext}'
+
+
+def current_artifact_version():
+    """公開中の成果物のバージョン名 (なければ None)"""
+    try:
+        with open(os.path.join(ARTIFACT_DIR, 'CURRENT'), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def read_artifact_manifest(version: str) -> dict:
+    # バージョンのディレクトリは書き終えてから公開し、以後変更しないので、バージョンごとに1度だけ読む
+    try:
+        with open(os.path.join(ARTIFACT_DIR, version, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('format_version') != ARTIFACT_FORMAT_VERSION or manifest.get('cache_format_version') != CACHE_FORMAT_VERSION:
+        return {}
+    return manifest
+
+
+class PartitionArtifacts:
+    """1パーティション分の事前計算の成果物。ファイルがなければ None を返すので、呼び出し側で計算する"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _read_bytes(self, *relative_path) -> bytes:
+        try:
+            with open(os.path.join(self.path, *relative_path), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def cube(self) -> pd.DataFrame:
+        path = os.path.join(self.path, 'cube.feather')
+        if not os.path.exists(path):
+            return None
+        cube = _unflatten_components(attach_shared_frame(path))
+        cube.columns.names = ['Method', 'Metric']
+        return cube
+
+    def trend_array(self) -> TrendArray:
+        try:
+            with np.load(os.path.join(self.path, 'trend.npz')) as arrays:
+                return TrendArray(arrays['teams'].tolist(), arrays['metrics'].tolist(), arrays['values'], arrays['opponents'],
+                                  arrays['opponent_matchdays'])
+        except (OSError, KeyError):
+            return None
+
+    def ranking_excel(self, ranking_method: str, selected_ranking_var: str) -> bytes:
+        return self._read_bytes('rankings', artifact_file_name(ranking_method, selected_ranking_var, ext='xlsx'))
+
+    def league_workbook(self) -> bytes:
+        return self._read_bytes('workbook.xlsx')
+
+    def ranking_image(self, backend: str, rank_method: str, rank_var: str, team: str) -> tuple:
+        image_format = RANKING_TABLE_BACKENDS[backend][1]
+        image = self._read_bytes('images', backend, artifact_file_name(rank_method, rank_var, team, ext=image_format))
+        return (image, image_format) if image is not None else None
+
+
+def find_partition_artifacts(league_key: str, season: int):
+    """公開中の成果物のうち、元CSVと内容 (sha256) が一致するパーティションのものを返す (なければ None)"""
+    version = current_artifact_version()
+    if version is None:
+        return None
+    entry = read_artifact_manifest(version).get('partitions', {}).get(f'{season}_{league_key}')
+    if entry is None:
+        return None
+    try:
+        _, meta = _partition_cache_state(league_key, partition_file_name(league_key, season))
+    except OSError:
+        return None
+    if meta.get('sha256') != entry['sha256']:
+        return None
+    return PartitionArtifacts(os.path.join(ARTIFACT_DIR, version, entry['path']))
+
+
+def find_season_artifacts(season: int, league_keys: list):
+    """シーズン単位の成果物 (HOME画面の散布図) のパス。対象リーグが全て公開中の成果物と一致する場合のみ"""
+    version = current_artifact_version()
+    if version is None:
+        return None
+    entry = read_artifact_manifest(version).get('seasons', {}).get(str(season))
+    if entry is None or sorted(entry['leagues']) != sorted(league_keys):
+        return None
+    if any(get_league_store(league_key, season).artifacts() is None for league_key in league_keys):
+        return None
+    return os.path.join(ARTIFACT_DIR, version, entry['path'])
+# --- 事前計算の成果物 終了 ---
+
+
+# --- 節ごとの追記 (インクリメンタル更新) ---
+# data/incoming/<リーグ>/*.csv に置かれた新しい試合行を、ファイル名順に1度だけ追記する
+# 書き込み側は *.tmp に書いてから os.replace で *.csv に置き換える。置き換えずにコピーする場合に備え、
+# 更新時刻から INCOMING_SETTLE_SECONDS 経っていないファイルは書き込み途中とみなして次の確認まで待つ
+INCOMING_DIR = os.path.join(DATA_DIR, 'incoming')
+INCOMING_SETTLE_SECONDS = float(os.environ.get('JLEAGUE_INCOMING_SETTLE_SECONDS', '5'))
+INCOMING_REQUIRED_COLUMNS = ['Team', 'Match ID', 'Match Date']
+
+
+@st.cache_resource(show_spinner=False)
+def _store_version_counter():
+    # スクリプトは再実行のたびにモジュール変数が作り直されるため、カウンタはプロセス単位で保持する
+    return itertools.count(1)
+
+
+class LeagueStore:
+    """リーグデータと集計の構成要素を保持し、新しい試合行を追記で反映する
+
+    集計キューブは合計・件数・最大・最小から組み立てるため、追記時は新しいバッチ分だけを集計すればよい。
+    """
+
+    def __init__(self, league_key: str, df: pd.DataFrame, season: int = DEFAULT_SEASON, source_signature: tuple = None,
+                 components: pd.DataFrame = None, load_error: str = None, matchday_generated: bool = False):
+        self.league_key = league_key
+        self.season = season
+        # ロード時の状態 (描画側で表示する)
+        self.load_error = load_error
+        self.matchday_generated = matchday_generated
+        self._lock = threading.RLock()
+        self._ingested_files = set()
+        self._failed_files = {}  # 取り込みに失敗したファイル -> (更新時刻, サイズ)。ファイルが変わるまで読み直さない
+        # バックグラウンドのスレッドからも使えるよう、バージョンのカウンタはここで取得しておく
+        self._version_counter = _store_version_counter()
+        self._source_signature = source_signature
+        self._last_source_check = time.monotonic()
+        self._refresh_thread = None
+        self._apply_state(self._build_state(df, components))
+
+    def _build_state(self, df: pd.DataFrame, components: pd.DataFrame = None) -> dict:
+        """データフレームから集計の構成要素などの状態を作る (ロックの外で計算できる)
+
+        共有ストアに公開済みの構成要素 components を渡せば、集計をやり直さない。
+        """
+        if components is None:
+            components = aggregate_components(df) if not df.empty else pd.DataFrame()
+        state = {
+            '_chunks': [df] if not df.empty else [],
+            '_frame': df,
+            '_components': components,
+            '_cube': None,
+            '_match_table': None,
+            '_trend_array': None,
+            '_last_matchday': pd.Series(dtype='int64'),
+            '_last_date': pd.Series(dtype='datetime64[ns]'),
+            '_seen_matches': set(),
+            '_appended': False,
+        }
+        if not df.empty and 'Matchday' in df.columns and 'Match ID' in df.columns:
+            matches = df[['Team', 'Match ID']].drop_duplicates()
+            state['_seen_matches'] = set(zip(matches['Team'], matches['Match ID']))
+            state['_last_matchday'], state['_last_date'] = self._team_progress(df, state['_last_matchday'], state['_last_date'])
+        return state
+
+    def _apply_state(self, state: dict):
+        """作成済みの状態をまとめて差し替え、バージョンを上げる"""
+        with self._lock:
+            self.__dict__.update(state)
+            self.version = next(self._version_counter)
+
+    def _reset(self, df: pd.DataFrame):
+        self._apply_state(self._build_state(df))
+
+    @staticmethod
+    def _team_progress(df: pd.DataFrame, last_matchday: pd.Series, last_date: pd.Series) -> tuple:
+        """チームごとの直近の (節番号, 試合日) を df の分だけ進めて返す"""
+        grouped = df.groupby('Team', observed=True)
+        progress = {'Matchday': last_matchday, 'Match Date': last_date}
+        for column, previous in progress.items():
+            if column not in df.columns:
+                continue
+            latest = grouped[column].max()
+            latest.index = pd.Index(latest.index.tolist(), name='Team')
+            progress[column] = pd.concat([previous, latest]).groupby(level=0).max() if not previous.empty else latest
+        return progress['Matchday'], progress['Match Date']
+
+    def _update_team_progress(self, df: pd.DataFrame):
+        """チームごとの直近の節番号と試合日を更新する"""
+        self._last_matchday, self._last_date = self._team_progress(df, self._last_matchday, self._last_date)
+
+    @property
+    def refreshing(self) -> bool:
+        """バックグラウンドで元CSVを再読み込み中かどうか"""
+        return self._refresh_thread is not None
+
+    def refresh_if_changed(self) -> bool:
+        """元CSVが更新されていればバックグラウンドで再読み込みを始める。完了するまでは今のデータを返し続ける"""
+        if self._source_signature is None:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if self._refresh_thread is not None or now - self._last_source_check < SOURCE_CHECK_INTERVAL:
+                return False
+            self._last_source_check = now
+            signature = partition_signature(self.league_key, self.season)
+            if signature is None or signature == self._source_signature:
+                return False
+            self._refresh_thread = threading.Thread(
+                target=self._refresh, args=(signature,), name=f'refresh-{self.season}-{self.league_key}', daemon=True,
+            )
+            self._refresh_thread.start()
+            return True
+
+    def _refresh(self, signature: tuple):
+        """再読み込みと集計をロックの外で行い、完了したら状態を一度に差し替える"""
+        start = time.perf_counter()
+        try:
+            df = load_league_frame(self.league_key, self.season)
+            state = self._build_state(df, read_published_components(self.league_key, self.season))
+            state['matchday_generated'] = matchday_was_generated(df, self.league_key, self.season)
+        except Exception:
+            logger.exception('[%s %s] バックグラウンド更新に失敗しました (前回のデータを表示し続けます)', self.season, self.league_key)
+            with self._lock:
+                # 同じ内容のファイルで失敗を繰り返さないよう、次にファイルが変わるまで待つ
+                self._source_signature = signature
+                self._refresh_thread = None
+            return
+        with self._lock:
+            self._apply_state(state)
+            self._source_signature = signature
+            # 元CSVから作り直したので、incomingのCSVは次の取り込みで再度追記する (取り込み済みの試合は除外される)
+            self._ingested_files = set()
+            self._failed_files = {}
+            self._refresh_thread = None
+        log_perf(f'background_refresh:{self.season}:{self.league_key}', ms=round((time.perf_counter() - start) * 1000, 3))
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        """追記分を含むリーグ全体のデータフレーム (結合は参照時に1度だけ行う)"""
+        with self._lock:
+            if self._frame is None:
+                self._frame = concat_league_frames(self._chunks) if self._chunks else pd.DataFrame()
+                self._chunks = [self._frame]
+            return self._frame
+
+    def artifacts(self):
+        """元CSVと一致する事前計算の成果物 (追記済み・再読み込み待ち/中の場合は、表示中のデータと合わないので None)"""
+        with self._lock:
+            if self._source_signature is None or self._appended or self.refreshing:
+                return None
+            if partition_signature(self.league_key, self.season) != self._source_signature:
+                return None
+        return find_partition_artifacts(self.league_key, self.season)
+
+    def components(self) -> pd.DataFrame:
+        """Team × (構成要素, 指標) の集計の構成要素 (シーズン間の比較用)"""
+        with self._lock:
+            return self._components
+
+    def cube(self) -> pd.DataFrame:
+        """Team × (集計方法, 指標) の集計キューブ"""
+        with self._lock:
+            if self._cube is None:
+                artifacts = self.artifacts()
+                cube = artifacts.cube() if artifacts else None
+                self._cube = cube if cube is not None else cube_from_components(self._components)
+            return self._cube
+
+    def match_table(self) -> pd.DataFrame:
+        """(Team, Match ID) ごとの試合表 (対戦相手の参照用)"""
+        with self._lock:
+            if self._match_table is None:
+                frame = self.frame
+                self._match_table = build_match_table(frame) if not frame.empty and 'Match ID' in frame.columns else pd.DataFrame()
+            return self._match_table
+
+    def trend_array(self) -> TrendArray:
+        """シーズン動向用の Team × Matchday × Metric 配列"""
+        with self._lock:
+            if self._trend_array is None:
+                artifacts = self.artifacts()
+                trend_array = artifacts.trend_array() if artifacts else None
+                self._trend_array = trend_array if trend_array is not None else build_trend_array(self.match_table())
+            return self._trend_array
+
+    def append(self, batch: pd.DataFrame) -> int:
+        """新しい試合行を追記し、追加した行数を返す (既に取り込んだ試合の行は無視する)
+
+        INCOMING_REQUIRED_COLUMNS の列がなければ ValueError (何も追記しない)。
+        """
+        missing = [column for column in INCOMING_REQUIRED_COLUMNS if column not in batch.columns]
+        if missing:
+            raise ValueError(f"追記する行に必須の列がありません: {', '.join(missing)}")
+        if batch.empty:
+            return 0
+        batch = batch.copy()
+        batch['League'] = self.league_key
+        batch['Match Date'] = pd.to_datetime(batch['Match Date'], errors='coerce')
+
+        with self._lock:
+            # 再配信された試合 (同じ Team, Match ID) は取り込まない
+            keys = list(zip(batch['Team'], batch['Match ID']))
+            is_new = np.fromiter((key not in self._seen_matches for key in keys), dtype=bool, count=len(keys))
+            batch = batch.loc[is_new]
+            if batch.empty:
+                return 0
+
+            # 既存の試合より前の日付が含まれる場合は節番号がずれるため、全体を再計算する
+            first_dates = batch.groupby('Team')['Match Date'].min()
+            previous = self._last_date.reindex(first_dates.index)
+            if (first_dates < previous).any():
+                rebuilt = prepare_league_frame(concat_league_frames([self.frame.drop(columns='Matchday'), batch]), self.league_key)
+                self._reset(rebuilt)
+                self._appended = True
+                return len(batch)
+
+            # バッチ内のチームごとの試合順に、各チームの直近の節番号を加算する
+            matchday = derive_matchday(batch)
+            valid = matchday > 0
+            batch = batch.loc[valid]
+            offset = batch['Team'].map(self._last_matchday).fillna(0).to_numpy(dtype=np.int64)
+            batch['Matchday'] = matchday[valid] + offset
+            batch = apply_league_schema(batch)
+
+            self._components = merge_components(self._components, aggregate_components(batch))
+            self._seen_matches.update(zip(batch['Team'], batch['Match ID']))
+            self._update_team_progress(batch)
+            self._chunks.append(batch)
+            self._appended = True
+            self._frame = None
+            self._cube = None
+            self._trend_array = None
+            # 試合表はバッチ分だけ作って追加する (既存の試合の片方のチームだけが届いていた場合は作り直す)
+            if self._match_table is not None:
+                existing_ids = self._match_table.index.get_level_values('Match ID')
+                if batch['Match ID'].isin(existing_ids).any():
+                    self._match_table = None
+                else:
+                    self._match_table = pd.concat([self._match_table, build_match_table(batch)]).sort_index()
+            self.version = next(self._version_counter)
+            return len(batch)
+
+    def ingest_incoming(self) -> int:
+        """incomingフォルダの未取り込みCSVを追記し、追加した行数を返す
+
+        不正なファイルはログに残して飛ばし (アプリは止めない)、内容が変わるまで読み直さない。
+        """
+        directory = os.path.join(INCOMING_DIR, self.league_key)
+        if not os.path.isdir(directory):
+            return 0
+        added = 0
+        now = time.time()
+        for file_name in sorted(os.listdir(directory)):
+            if not file_name.endswith('.csv') or file_name in self._ingested_files:
+                continue
+            path = os.path.join(directory, file_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if self._failed_files.get(file_name) == signature or now - stat.st_mtime < INCOMING_SETTLE_SECONDS:
+                continue
+            try:
+                added += self.append(pd.read_csv(path))
+            except Exception:
+                logger.exception('[%s %s] %s を取り込めませんでした (ファイルが更新されるまで読み直しません)',
+                                 self.season, self.league_key, path)
+                self._failed_files[file_name] = signature
+                continue
+            self._ingested_files.add(file_name)
+        return added
+
+
+@st.cache_resource(show_spinner=False)
+def _loaded_store_keys() -> set:
+    # _get_league_store でロード済みの (リーグ, シーズン)。max_entries で追い出された後も残るが、その場合は逐次ロードになるだけ
+    return set()
+
+
+@st.cache_resource(max_entries=PARTITION_CACHE_ENTRIES, show_spinner=False)
+def _get_league_store(league_key, season):
+    signature = partition_signature(league_key, season)
+    load_error = None
+    try:
+        df = get_data(league_key, season, signature)
+    except Exception:
+        logger.exception('[%s %s] データのロードに失敗しました', season, league_key)
+        df = pd.DataFrame()
+        load_error = (f"{league_key} データ ({partition_file_name(league_key, season)}) のロードに失敗しました。"
+                      "ファイルが存在するか確認してください。")
+    # 集計の構成要素も共有ストアから読み、ワーカーごとに集計し直さない
+    components = read_published_components(league_key, season) if not df.empty else None
+    store = LeagueStore(league_key, df, season, signature, components, load_error, matchday_was_generated(df, league_key, season))
+    _loaded_store_keys().add((league_key, season))
+    return store
+
+
+def get_league_store(league_key, season=DEFAULT_SEASON) -> LeagueStore:
+    """パーティションのストアを返す
+
+    元CSVが更新されていればバックグラウンドで再読み込みし、終わるまでは前回のデータを返す (期限切れで待たせない)。
+    最新シーズンなら、incomingフォルダの新しい節をその分だけ追記する。
+    """
+    store = _get_league_store(league_key, season)
+    store.refresh_if_changed()
+    if season == available_seasons()[0]:
+        store.ingest_incoming()
+    return store
+
+
+def get_aggregate_cube(league_key, season=DEFAULT_SEASON):
+    """リーグごとの集計キューブ (ランキング系タブ共通) を返す"""
+    return get_league_store(league_key, season).cube()
+
+
+@budget_cached('partition_components')
+def _get_partition_components(league_key, season, source_signature):
+    return load_partition_components(league_key, season)
+
+
+def get_partition_components(league_key, season):
+    """シーズン間の比較用に、パーティションの集計の構成要素だけを返す (行データは保持しない)"""
+    return _get_partition_components(league_key, season, partition_signature(league_key, season))
+
+
+def build_season_comparison(components_by_season: dict, ranking_method: str, metric: str) -> pd.DataFrame:
+    """シーズンごとの集計の構成要素から Team × シーズン (+ 通算) の表を作る
+
+    通算は構成要素を結合してから集計方法を適用するため、平均も行データを読み直さずに正しく求まる。
+    """
+    table = pd.DataFrame({
+        str(season): cube_from_components(components)[ranking_method][metric]
+        for season, components in components_by_season.items()
+    })
+    combined = functools.reduce(merge_components, components_by_season.values())
+    table['通算'] = cube_from_components(combined)[ranking_method][metric]
+    table.index.name = 'Team'
+    return table
+
+
+def ranking_var_options(ranking_method: str) -> list:
+    """集計ランキングの指標の選択肢 (Totalの場合は 'Distance' を 'Distance (km)' と表示)"""
+    return [v.replace('Distance', 'Distance (km)') if v == 'Distance' and ranking_method == 'Total' else v for v in available_vars]
+
+
+def build_ranking_plot_data(team_stats_aggregated: pd.DataFrame, ranking_method: str, selected_ranking_var: str):
+    """集計結果から (グラフ描画用データ, 並べ替えに使う列名, 昇順かどうか, ツールチップの書式) を作成する"""
+    # 実際に集計に使用する列名 (kmをmに戻す)
+    actual_var = selected_ranking_var.replace(' (km)', '')
+    plot_data = team_stats_aggregated.copy()
+
+    # 選択された指標がDistanceで、集計方法がTotalの場合の調整
+    if selected_ranking_var == 'Distance (km)':
+        var_to_rank = 'Distance (km)'
+        # Distanceをkmに変換
+        plot_data[var_to_rank] = plot_data[actual_var] / 1000
+        tooltip_format = '.1f'
+        sort_ascending = False
+    else:
+        var_to_rank = actual_var
+        # Minの場合は昇順
+        sort_ascending = True if ranking_method == 'Min' else False
+        tooltip_format = ',.0f' if ranking_method in ['Total', 'Max'] and 'Count' in var_to_rank else '.2f'
+
+    # ランキングのソート
+    plot_data = plot_data.sort_values(by=var_to_rank, ascending=sort_ascending).reset_index(drop=True)
+    return plot_data, var_to_rank, sort_ascending, tooltip_format
+
+
+def ranking_download_frame(aggregate_cube: pd.DataFrame, ranking_method: str, selected_ranking_var: str) -> pd.DataFrame:
+    """ダウンロード用の (Team, 指標) ランキング表"""
+    actual_var = selected_ranking_var.replace(' (km)', '')
+    plot_data, var_to_rank, _, _ = build_ranking_plot_data(
+        aggregate_cube[ranking_method][[actual_var]].reset_index(), ranking_method, selected_ranking_var
+    )
+    return plot_data[['Team', var_to_rank]]
+
+
+@budget_cached('ranking_excel')
+def get_ranking_excel(league_key, season, data_version, ranking_method, selected_ranking_var) -> bytes:
+    """1つのランキングのxlsx (ダウンロードボタンが押された時だけ生成し、データのバージョンごとに再利用する)"""
+    artifacts = get_league_store(league_key, season).artifacts()
+    workbook = artifacts.ranking_excel(ranking_method, selected_ranking_var) if artifacts else None
+    if workbook is not None:
+        return workbook
+    return to_excel(ranking_download_frame(get_aggregate_cube(league_key, season), ranking_method, selected_ranking_var))
+
+
+def _excel_sheet_name(name: str) -> str:
+    # Excelのシート名は31文字以内で、 / \ ? * [ ] : を含められない
+    return re.sub(r'[/\\?*\[\]:]', '_', name)[:31]
+
+
+@instrumented()
+def build_league_workbook(aggregate_cube: pd.DataFrame) -> bytes:
+    """全集計方法×全指標のランキングを1シートずつ持つxlsxを作成する
+
+    xlsxwriterの constant_memory モードで行順に1回だけ書き出すため、シート数が増えてもメモリは一定。
+    """
+    import xlsxwriter
+
+    output = BytesIO()
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    header_format = workbook.add_format({'bold': True})
+    metric_vars = aggregate_cube.columns.get_level_values('Metric').unique() if not aggregate_cube.empty else []
+    for ranking_method in RANKING_METHODS:
+        for selected_ranking_var in ranking_var_options(ranking_method):
+            if selected_ranking_var.replace(' (km)', '') not in metric_vars:
+                continue
+            ranking = ranking_download_frame(aggregate_cube, ranking_method, selected_ranking_var)
+            worksheet = workbook.add_worksheet(_excel_sheet_name(f'{ranking_method} {selected_ranking_var}'))
+            worksheet.write_row(0, 0, ranking.columns.tolist(), header_format)
+            for row, (team, value) in enumerate(ranking.itertuples(index=False), start=1):
+                worksheet.write_string(row, 0, str(team))
+                if pd.notna(value):
+                    worksheet.write_number(row, 1, float(value))
+    workbook.close()
+    return output.getvalue()
+
+
+@budget_cached('league_workbook')
+def get_league_workbook(league_key, season, data_version) -> bytes:
+    """リーグ全体のランキングxlsx (ダウンロードボタンが押された時だけ生成する)"""
+    artifacts = get_league_store(league_key, season).artifacts()
+    workbook = artifacts.league_workbook() if artifacts else None
+    return workbook if workbook is not None else build_league_workbook(get_aggregate_cube(league_key, season))
+
+
+# --- 2. 描画ロジック関数 (共通関数) ---
+
+def build_custom_ranking_table(aggregate_cube: pd.DataFrame, rank_method: str, rank_var: str) -> pd.DataFrame:
+    """集計キューブから描画用のランキング表 (下位が先頭) を作成する"""
+    # データの集計ロジック (集計キューブから該当列を取り出すだけ)
+    rank_df = aggregate_cube[rank_method][[rank_var]].reset_index()
+    sort_method = rank_method == 'Min'
 
     # 最終的なランキングデータフレームの作成
     if sort_method: 
@@ -165,107 +1482,232 @@ def render_custom_ranking(df: pd.DataFrame, league_name: str, team_colors: dict,
     else: 
         indexdf_short = rank_df.sort_values(by=[rank_var], ascending=False)[['Team', rank_var]].reset_index(drop=True)
     
-    indexdf_short = indexdf_short[::-1]
+    return indexdf_short[::-1]
 
-    if indexdf_short.empty:
-        st.warning("集計されたデータが空のため、ランキングを表示できません。")
-        return
 
+RANKING_TEXT_COLOR = '#4A2E19'
+RANKING_BACKGROUND = '#fbf9f4'
+# 表の描画バックエンド: 'matplotlib' (従来のannotateループ), 'matplotlib_batched' (一括描画), 'svg' (Matplotlib不使用)
+RANKING_TABLE_BACKEND = os.environ.get('JLEAGUE_TABLE_BACKEND', 'matplotlib_batched')
+
+
+def _ranking_row_labels(indexdf_short: pd.DataFrame, rank_method: str) -> list:
+    """各行の (チーム名, 'Rank / Team' 列の文字列, 指標列の文字列) を返す (表示順は下位が先頭)"""
+    nrows = indexdf_short.shape[0]
+    value_column = indexdf_short.columns[1]
+    labels = []
+    for i, (team_name, value) in enumerate(zip(indexdf_short['Team'], indexdf_short[value_column])):
+        rank = nrows - i
+        team_label = f'{rank}     {team_name}' if rank < 10 else f'{rank}   {team_name}'
+        # Distanceをkmに変換して表示 (Totalの場合のみ)
+        if value_column == 'Distance' and rank_method == 'Total':
+            value_label = f'{round(value / 1000, 2)} km'
+        else:
+            value_label = f'{round(value, 2)}'
+        labels.append((team_name, team_label, value_label))
+    return labels
+
+
+def _render_ranking_annotate(indexdf_short: pd.DataFrame, team: str, focal_color: str, rank_method: str, rank_var: str) -> bytes:
+    """従来の描画: セルごとに ax.annotate、罫線ごとに ax.plot を呼び、bbox_inches='tight' でPNG化する"""
     # --- Matplotlib/Seaborn 描画ロジック ---
-    sns.set(rc={'axes.facecolor':'#fbf9f4', 'figure.facecolor':'#fbf9f4',
-                'ytick.labelcolor':'#4A2E19', 'xtick.labelcolor':'#4A2E19'})
+    sns.set(rc={'axes.facecolor':RANKING_BACKGROUND, 'figure.facecolor':RANKING_BACKGROUND,
+                'ytick.labelcolor':RANKING_TEXT_COLOR, 'xtick.labelcolor':RANKING_TEXT_COLOR})
 
     fig = plt.figure(figsize=(7, 8), dpi=200)
-    ax = plt.subplot()
+    try:
+        ax = fig.add_subplot()
+    
+        ncols = len(indexdf_short.columns.tolist()) + 1
+        nrows = indexdf_short.shape[0]
+
+        ax.set_xlim(0, ncols + .5)
+        ax.set_ylim(0, nrows + 1.5)
+    
+        positions = [0.05, 2.0]
+    
+        for i, (team_name, team_label, value_label) in enumerate(_ranking_row_labels(indexdf_short, rank_method)):
+            is_focal = team_name == team
+            t_color = focal_color if is_focal else RANKING_TEXT_COLOR
+            weight = 'bold' if is_focal else 'regular'
+
+            for j, text_label in enumerate([team_label, value_label]):
+                ax.annotate(
+                    xy=(positions[j], i + .5),
+                    text = text_label,
+                    ha='left', va='center', color=t_color, weight=weight
+                )
+            
+        # テーブルヘッダー描画
+        column_names = ['Rank / Team', rank_var]
+        for index, cs in enumerate(column_names):
+            pos = positions[index]
+            ax.annotate(xy=(pos, nrows + .75), text=column_names[index], ha='left', va='bottom', weight='bold', color=RANKING_TEXT_COLOR)
+
+        # 罫線
+        ax.plot([ax.get_xlim()[0], ax.get_xlim()[1]], [nrows + 0.5, nrows + 0.5], lw=1.5, color='black', marker='', zorder=4)
+        ax.plot([ax.get_xlim()[0], ax.get_xlim()[1]], [0, 0], lw=1.5, color='black', marker='', zorder=4)
+        for x in range(1, nrows):
+            ax.plot([ax.get_xlim()[0], ax.get_xlim()[1]], [x, x], lw=1.15, color='gray', ls=':', zorder=3 , marker='')
     
+        ax.set_axis_off() 
+    
+        # タイトル描画
+        fig.text(x=0.08, y=.95, s=f"{rank_var} {rank_method} Rankings",
+            ha='left', va='bottom', weight='bold', size=13, color=RANKING_TEXT_COLOR)
+
+        # st.pyplot と同じ設定でPNG化する
+        output = BytesIO()
+        fig.savefig(output, format='png', dpi=200, bbox_inches='tight')
+        return output.getvalue()
+    finally:
+        plt.close(fig)
+
+
+def _render_ranking_batched(indexdf_short: pd.DataFrame, team: str, focal_color: str, rank_method: str, rank_var: str) -> bytes:
+    """一括描画: 罫線を2つのLineCollectionにまとめ、固定レイアウトで1回だけ描画してPNG化する
+
+    pyplotやseabornのグローバル状態を使わないため、複数セッションから同時に呼んでも安全。
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.collections import LineCollection
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(7, 8), dpi=200, facecolor=RANKING_BACKGROUND)
+    FigureCanvasAgg(fig)
+    # bbox_inches='tight' は余白計算のために2回描画するため、余白を決め打ちした軸を使う
+    ax = fig.add_axes([0.06, 0.03, 0.9, 0.89])
+    ax.set_axis_off()
+
     ncols = len(indexdf_short.columns.tolist()) + 1
     nrows = indexdf_short.shape[0]
-
-    ax.set_xlim(0, ncols + .5)
+    xlim = (0, ncols + .5)
+    ax.set_xlim(*xlim)
     ax.set_ylim(0, nrows + 1.5)
-    
     positions = [0.05, 2.0]
-    columns = indexdf_short.columns.tolist()
-    
-    for i in range(nrows):
-        team_name = indexdf_short['Team'].iloc[i]
+
+    for i, (team_name, team_label, value_label) in enumerate(_ranking_row_labels(indexdf_short, rank_method)):
         is_focal = team_name == team
-        t_color = focal_color if is_focal else '#4A2E19'
-        weight = 'bold' if is_focal else 'regular'
+        style = dict(ha='left', va='center', fontsize=12, color=focal_color if is_focal else RANKING_TEXT_COLOR,
+                     weight='bold' if is_focal else 'normal')
+        ax.text(positions[0], i + .5, team_label, **style)
+        ax.text(positions[1], i + .5, value_label, **style)
 
-        rank = nrows - i
-        
-        for j, column in enumerate(columns):
-            if column == 'Team':
-                text_label = f'{rank}     {team_name}' if rank < 10 else f'{rank}   {team_name}'
-            else:
-                # Distanceをkmに変換して表示 (Totalの場合のみ)
-                if column == 'Distance' and rank_method == 'Total':
-                    text_label = f'{round(indexdf_short[column].iloc[i] / 1000, 2)} km'
-                else:
-                    text_label = f'{round(indexdf_short[column].iloc[i],2)}'
-            
-            ax.annotate(
-                xy=(positions[j], i + .5),
-                text = text_label,
-                ha='left', va='center', color=t_color, weight=weight
-            )
-            
     # テーブルヘッダー描画
-    column_names = ['Rank / Team', rank_var]
-    for index, cs in enumerate(column_names):
-        pos = positions[index]
-        ax.annotate(xy=(pos, nrows + .75), text=column_names[index], ha='left', va='bottom', weight='bold', color='#4A2E19')
-
-    # 罫線
-    ax.plot([ax.get_xlim()[0], ax.get_xlim()[1]], [nrows + 0.5, nrows + 0.5], lw=1.5, color='black', marker='', zorder=4)
-    ax.plot([ax.get_xlim()[0], ax.get_xlim()[1]], [0, 0], lw=1.5, color='black', marker='', zorder=4)
-    for x in range(1, nrows):
-        ax.plot([ax.get_xlim()[0], ax.get_xlim()[1]], [x, x], lw=1.15, color='gray', ls=':', zorder=3 , marker='')
-    
-    ax.set_axis_off() 
-    
+    for pos, header in zip(positions, ['Rank / Team', rank_var]):
+        ax.text(pos, nrows + .75, header, ha='left', va='bottom', fontsize=12, weight='bold', color=RANKING_TEXT_COLOR)
+
+    # 罫線 (実線2本と点線 nrows-1 本をそれぞれ1つのコレクションで描画)
+    ax.add_collection(LineCollection([[(xlim[0], y), (xlim[1], y)] for y in (nrows + 0.5, 0)], linewidths=1.5, colors='black', zorder=4))
+    ax.add_collection(LineCollection([[(xlim[0], y), (xlim[1], y)] for y in range(1, nrows)], linewidths=1.15, colors='gray', linestyles=':', zorder=3))
+
     # タイトル描画
     fig.text(x=0.08, y=.95, s=f"{rank_var} {rank_method} Rankings",
-        ha='left', va='bottom', weight='bold', size=13, color='#4A2E19')
-    
-    st.pyplot(fig)
+        ha='left', va='bottom', weight='bold', size=13, color=RANKING_TEXT_COLOR)
 
+    output = BytesIO()
+    fig.savefig(output, format='png', dpi=200, facecolor=RANKING_BACKGROUND)
+    return output.getvalue()
 
-# Plotly Expressを使用した散布図描画関数 (HOME画面用)
-def render_scatter_plot(df: pd.DataFrame, available_vars: list, team_colors: dict, league_color_map: dict):
-    """チーム別集計データに基づいて散布図を描画する"""
-    st.markdown("### 📊 J.League 全体分析：散布図")
-    
-    if 'League' not in df.columns:
-        st.error("データに 'League' の列がありません。データロード関数を確認してください。")
-        return
-        
-    # データの集計: チームとリーグでグループ化し、全指標の平均を算出
-    team_avg_df = df.groupby(['Team', 'League'])[available_vars].mean().reset_index()
 
-    if team_avg_df.empty:
-        st.warning("集計データが空です。")
-        return
+def _render_ranking_svg(indexdf_short: pd.DataFrame, team: str, focal_color: str, rank_method: str, rank_var: str) -> bytes:
+    """SVG描画: Matplotlibを使わずに同じ体裁の表をSVG文字列として直接組み立てる"""
+    width, height = 700, 800
+    left, top, table_width = 42, 88, 630
+    nrows = indexdf_short.shape[0]
+    row_height = (height - top - 24) / (nrows + 1)
+    x_positions = [left + table_width * 0.05 / 3.5, left + table_width * 2.0 / 3.5]
+
+    def y_of(row_units):
+        # Matplotlibと同じく下から上へ行を積む (row_units=0 が表の下端)
+        return top + (nrows + 1 - row_units) * row_height
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" width="{width}" height="{height}" '
+        f'font-family="DejaVu Sans, Verdana, sans-serif" font-size="15">',
+        f'<rect width="100%" height="100%" fill="{RANKING_BACKGROUND}"/>',
+        f'<text x="{left + 14}" y="{top - 38}" font-size="20" font-weight="bold" fill="{RANKING_TEXT_COLOR}">'
+        f'{html.escape(f"{rank_var} {rank_method} Rankings")}</text>',
+    ]
+    for x, header in zip(x_positions, ['Rank / Team', rank_var]):
+        parts.append(f'<text x="{x:.1f}" y="{y_of(nrows + .75):.1f}" font-weight="bold" fill="{RANKING_TEXT_COLOR}">{html.escape(header)}</text>')
+    for i, (team_name, team_label, value_label) in enumerate(_ranking_row_labels(indexdf_short, rank_method)):
+        is_focal = team_name == team
+        attrs = f'fill="{focal_color if is_focal else RANKING_TEXT_COLOR}"' + (' font-weight="bold"' if is_focal else '')
+        y = y_of(i + .5)
+        for x, label in zip(x_positions, [team_label, value_label]):
+            parts.append(f'<text x="{x:.1f}" y="{y:.1f}" dominant-baseline="central" xml:space="preserve" {attrs}>{html.escape(label)}</text>')
+    for y in range(1, nrows):
+        parts.append(f'<line x1="{left}" x2="{left + table_width}" y1="{y_of(y):.1f}" y2="{y_of(y):.1f}" stroke="gray" stroke-width="1.15" stroke-dasharray="1.5 2.5"/>')
+    for y in (nrows + 0.5, 0):
+        parts.append(f'<line x1="{left}" x2="{left + table_width}" y1="{y_of(y):.1f}" y2="{y_of(y):.1f}" stroke="black" stroke-width="1.5"/>')
+    parts.append('</svg>')
+    return '\n'.join(parts).encode('utf-8')
+
+
+# バックエンド名 -> (描画関数, 出力形式)
+RANKING_TABLE_BACKENDS = {
+    'matplotlib': (_render_ranking_annotate, 'png'),
+    'matplotlib_batched': (_render_ranking_batched, 'png'),
+    'svg': (_render_ranking_svg, 'svg'),
+}
+
+
+@instrumented()
+def render_ranking_image(indexdf_short: pd.DataFrame, team: str, focal_color: str, rank_method: str, rank_var: str, backend: str = None):
+    """選択されたバックエンドでランキング表を描画し、(バイト列, 形式) を返す"""
+    render, image_format = RANKING_TABLE_BACKENDS[backend or RANKING_TABLE_BACKEND]
+    return render(indexdf_short, team, focal_color, rank_method, rank_var), image_format
+
+
+@instrumented(cached=True)
+def render_custom_ranking(df: pd.DataFrame, league_name: str, team_colors: dict, available_vars: list, aggregate_cube: pd.DataFrame, data_version=None,
+                          artifacts: PartitionArtifacts = None):
+    """カスタムランキング（Matplotlib）を描画する。事前計算の成果物 artifacts に画像があればそれを表示する"""
+    st.markdown("### 🏆 カスタムランキング作成")
+    
+    # UI要素の定義: keyをリーグごとにユニークにし、セッションステートの衝突を防ぐ
+    team = st.selectbox('注目チームを選択', df['Team'].unique(), key=f"focal_team_{league_name}") 
+    focal_color = team_colors.get(team, '#000000') 
 
-    # UI要素の定義 (X軸/Y軸)
     col1, col2 = st.columns(2)
     with col1:
-        x_var = st.selectbox('X軸の指標', available_vars, index=available_vars.index('Running Distance'), key='scatter_x_var_home')
+        rank_method = st.selectbox('集計方法 (Ranking Method)', RANKING_METHODS, key=f"rank_method_{league_name}") 
     with col2:
-        y_var = st.selectbox('Y軸の指標', available_vars, index=available_vars.index('HSR Distance'), key='scatter_y_var_home')
-        
-    # 色分けの基準
-    color_by = st.radio('色分けの基準', ['リーグ', '注目チーム', 'チーム別 (デフォルト)'], index=0, key='scatter_color_by_home')
-    
-    focal_team = None
-    if color_by == '注目チーム':
-        all_teams = sorted(team_avg_df['Team'].unique().tolist())
-        default_index = all_teams.index('Cerezo Osaka') if 'Cerezo Osaka' in all_teams else 0
-        focal_team = st.selectbox('注目チームを選択', all_teams, index=default_index, key='scatter_focal_team_home')
+        rank_var = st.selectbox('評価指標 (Metric to Rank)', available_vars, key=f"rank_var_{league_name}") 
+
+    # 一度描画したランキングはMatplotlibを使わずにキャッシュから表示する
+    image_cache = get_result_cache()
+    cache_key = ('ranking_image', league_name, data_version, RANKING_TABLE_BACKEND, rank_method, rank_var, team)
+    cached = image_cache.get(cache_key)
+    if cached is None and artifacts is not None:
+        cached = artifacts.ranking_image(RANKING_TABLE_BACKEND, rank_method, rank_var, team)
+        if cached is not None:
+            image_cache.put(cache_key, cached)
+    if cached is None:
+        mark_cache_miss()
+        indexdf_short = build_custom_ranking_table(aggregate_cube, rank_method, rank_var)
+
+        if indexdf_short.empty:
+            st.warning("集計されたデータが空のため、ランキングを表示できません。")
+            return
+
+        cached = render_ranking_image(indexdf_short, team, focal_color, rank_method, rank_var)
+        image_cache.put(cache_key, cached)
 
-    # チーム名とリーグ、選択指標を表示するリスト
+    image, image_format = cached
+    note_payload(image)
+    # SVGは文字列で渡す必要がある
+    st.image(image.decode('utf-8') if image_format == 'svg' else image, use_container_width=True)
+
+
+# Plotly Expressを使用した散布図描画関数 (HOME画面用)
+def build_scatter_figure(team_avg_df: pd.DataFrame, x_var: str, y_var: str, color_by: str, focal_team: str,
+                         team_colors: dict, league_color_map: dict) -> 'go.Figure':
+    """HOME画面の散布図 (Plotly) を作成する"""
+    # チーム名とリーグ、選択指標を表示するリスト (グラフのデータもこの列だけに絞る)
     hover_data_list = ['Team', 'League', x_var, y_var]
+    team_avg_df = team_avg_df[list(dict.fromkeys(hover_data_list))].copy()
 
     # Plotly Expressで散布図を描画
     if color_by == 'リーグ':
@@ -327,12 +1769,288 @@ def render_scatter_plot(df: pd.DataFrame, available_vars: list, team_colors: dic
         yaxis_title=f'{y_var} (平均)',
         hovermode="closest",
     )
+    return fig
+
+
+SCATTER_LEVELS = ['チーム平均', '試合・選手単位 (行データ)'] # HOME画面の散布図の表示単位
+# 行データの散布図でブラウザへ送る点の上限。超える場合はグリッドに集約する
+SCATTER_POINT_BUDGET = int(os.environ.get('JLEAGUE_SCATTER_POINT_BUDGET', '20000'))
+
+
+def density_downsample(points: pd.DataFrame, x_var: str, y_var: str, budget: int) -> tuple:
+    """点の数が budget を超える場合、Group ごとに x・y のグリッドのセルへ集約する (点はセル内の平均位置、Count は行数)
+
+    (点のフレーム, グリッドの分割数 (集約しない場合は None)) を返す。セルの数は Group 数 × 分割数の2乗なので budget を超えない。
+    """
+    if len(points) <= budget:
+        return points.assign(Count=1), None
+    groups = max(points['Group'].nunique(), 1)
+    bins = max(int(np.sqrt(budget / groups)), 2)
+    cells = {}
+    for axis, var in (('_x_bin', x_var), ('_y_bin', y_var)):
+        values = points[var].to_numpy(dtype=float)
+        low, high = values.min(), values.max()
+        scaled = (values - low) / (high - low) * bins if high > low else np.zeros(len(values))
+        cells[axis] = np.minimum(scaled.astype(np.int32), bins - 1)
+    grid = points.assign(**cells).groupby(['Group', '_x_bin', '_y_bin'], observed=True)
+    aggregated = grid[list(dict.fromkeys([x_var, y_var]))].mean()
+    aggregated['Count'] = grid.size()
+    return aggregated.reset_index(level='Group').reset_index(drop=True), bins
+
+
+@budget_cached('scatter_points')
+def get_scatter_points(overview_key: tuple, x_var: str, y_var: str, color_by: str, focal_team: str) -> tuple:
+    """行データの散布図の点 (Group・x・y。点が多い場合はグリッドに集約済み), 元の行数, グリッドの分割数"""
+    season, versions = overview_key
+    columns = list(dict.fromkeys(['Team', x_var, y_var]))
+    frames = []
+    for league_key, _ in versions:
+        frame = get_league_store(league_key, season).frame
+        if not frame.empty and set(columns) <= set(frame.columns):
+            # 全列を結合せず、使う列だけを取り出す
+            frames.append(frame[columns].assign(League=league_key))
+    if not frames:
+        return pd.DataFrame(columns=['Group', *columns]), 0, None
+    points = concat_league_frames(frames).dropna(subset=[x_var, y_var])
+    if color_by == 'リーグ':
+        points['Group'] = points['League']
+    elif color_by == '注目チーム' and focal_team:
+        points['Group'] = np.where(points['Team'] == focal_team, focal_team, 'その他')
+    else:
+        points['Group'] = points['Team'].astype(str)
+    downsampled, bins = density_downsample(points, x_var, y_var, SCATTER_POINT_BUDGET)
+    return downsampled, len(points), bins
+
+
+def build_row_scatter_figure(points: pd.DataFrame, rows: int, bins: int, x_var: str, y_var: str, color_by: str,
+                             focal_team: str, team_colors: dict, league_color_map: dict) -> 'go.Figure':
+    """行データの散布図 (WebGLのScattergl)。集約したセルは行数に応じてマーカーを大きくする"""
+    if color_by == 'リーグ':
+        group_colors = league_color_map
+    elif color_by == '注目チーム' and focal_team:
+        group_colors = {'その他': '#CCCCCC', focal_team: team_colors.get(focal_team, '#FF0000')}
+    else:
+        group_colors = team_colors
+    # 注目チームが「その他」に隠れないよう、色分けマップの順 (その他が先) にトレースを重ねる
+    order = [group for group in group_colors if group in set(points['Group'])]
+    order += sorted(set(points['Group']) - set(order))
+    max_count = points['Count'].max() if not points.empty else 1
+
+    fig = go.Figure()
+    for group in order:
+        part = points.loc[points['Group'] == group]
+        if bins is None:
+            marker = dict(color=group_colors.get(group, '#999999'), size=5, opacity=0.6)
+            customdata = part[['Team', 'League']].astype(str).to_numpy()
+            hovertemplate = f"<b>%{{customdata[0]}}</b> (%{{customdata[1]}})<br>{x_var}: %{{x:.2f}}<br>{y_var}: %{{y:.2f}}<extra></extra>"
+        else:
+            sizes = 4 + 12 * np.sqrt(part['Count'].to_numpy() / max_count)
+            marker = dict(color=group_colors.get(group, '#999999'), size=sizes, opacity=0.6)
+            customdata = part[['Count']].to_numpy()
+            hovertemplate = f"<b>{group}</b><br>{x_var}: %{{x:.2f}}<br>{y_var}: %{{y:.2f}}<br>行数: %{{customdata[0]:,}}<extra></extra>"
+        fig.add_trace(go.Scattergl(
+            x=part[x_var].to_numpy(), y=part[y_var].to_numpy(), mode='markers', name=str(group),
+            marker=marker, customdata=customdata, hovertemplate=hovertemplate,
+        ))
+
+    title = f'試合・選手単位: {y_var} vs {x_var} ({rows:,} 行'
+    title += f', {bins}×{bins} のグリッドに集約)' if bins is not None else ')'
+    fig.update_layout(title=title, xaxis_title=x_var, yaxis_title=y_var, hovermode='closest', height=600)
+    return fig
+
+
+@instrumented(cached=True)
+@budget_cached('scatter_spec')
+def get_scatter_spec(overview_key: tuple, x_var: str, y_var: str, color_by: str, focal_team: str, level: str) -> dict:
+    """散布図のspec (JSONにしたPlotlyの図)。全体データのバージョンと表示単位・軸・色分けの組み合わせごとに再利用する"""
+    mark_cache_miss()
+    if level == SCATTER_LEVELS[0] and color_by in ARTIFACT_SCATTER_COLORINGS:
+        season, versions = overview_key
+        artifact_path = find_season_artifacts(season, [league_key for league_key, _ in versions])
+        if artifact_path is not None:
+            try:
+                with open(os.path.join(artifact_path, 'scatter', artifact_file_name(color_by, x_var, y_var, ext='json')), encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass
+    if level == SCATTER_LEVELS[0]:
+        fig = build_scatter_figure(get_league_overview(*overview_key), x_var, y_var, color_by, focal_team, TEAM_COLORS, LEAGUE_COLOR_MAP)
+    else:
+        points, rows, bins = get_scatter_points(overview_key, x_var, y_var, color_by, focal_team)
+        fig = build_row_scatter_figure(points, rows, bins, x_var, y_var, color_by, focal_team, TEAM_COLORS, LEAGUE_COLOR_MAP)
+    return json.loads(fig.to_json())
+
+
+@instrumented()
+def render_scatter_plot(team_avg_df: pd.DataFrame, overview_key: tuple, available_vars: list):
+    """チーム別集計データ (Team・League × 指標の平均) に基づいて散布図を描画する
+
+    overview_key は team_avg_df を作った get_league_overview の引数 (グラフのspecのキャッシュキーに使う)。
+    """
+    st.markdown("### 📊 J.League 全体分析：散布図")
     
-    st.plotly_chart(fig, use_container_width=True)
+    if 'League' not in team_avg_df.columns:
+        st.error("データに 'League' の列がありません。データロード関数を確認してください。")
+        return
+
+    if team_avg_df.empty:
+        st.warning("集計データが空です。")
+        return
+
+    # UI要素の定義 (X軸/Y軸)
+    col1, col2 = st.columns(2)
+    with col1:
+        x_var = st.selectbox('X軸の指標', available_vars, index=available_vars.index('Running Distance'), key='scatter_x_var_home')
+    with col2:
+        y_var = st.selectbox('Y軸の指標', available_vars, index=available_vars.index('HSR Distance'), key='scatter_y_var_home')
+        
+    # 表示単位と色分けの基準
+    level = st.radio('表示単位', SCATTER_LEVELS, index=0, key='scatter_level_home', horizontal=True)
+    color_by = st.radio('色分けの基準', ['リーグ', '注目チーム', 'チーム別 (デフォルト)'], index=0, key='scatter_color_by_home')
+    
+    focal_team = None
+    if color_by == '注目チーム':
+        all_teams = sorted(team_avg_df['Team'].unique().tolist())
+        default_index = all_teams.index('Cerezo Osaka') if 'Cerezo Osaka' in all_teams else 0
+        focal_team = st.selectbox('注目チームを選択', all_teams, index=default_index, key='scatter_focal_team_home')
+
+    st.plotly_chart(get_scatter_spec(overview_key, x_var, y_var, color_by, focal_team, level), use_container_width=True)
+
+
+# --- チーム類似度 (HOME画面用) ---
+SIMILARITY_METRICS = {'コサイン類似度': 'cosine', 'ユークリッド距離': 'euclidean'}
+SIMILARITY_HEATMAP_MAX_ROWS = 200  # 全ペアのヒートマップを描く行数の上限 (選手単位では近傍検索だけにする)
+
+
+class ProfileMatrix:
+    """チーム (将来は選手) × 指標のプロファイルを指標ごとに標準化した行列。近傍検索と全ペアの距離をNumPyの行列演算で求める
+
+    欠損値は標準化後に0 (全体の平均) とする。1件の近傍検索は行数 n に対して O(n × 指標数) なので、選手単位の行でも使える。
+    """
+
+    def __init__(self, labels: list, groups: list, metrics: list, values: np.ndarray):
+        self.labels = labels
+        self.groups = groups
+        self.metrics = metrics
+        self.label_index = {label: i for i, label in enumerate(labels)}
+        values = values.astype(np.float64)
+        mean = np.nanmean(values, axis=0)
+        std = np.nanstd(values, axis=0)
+        std[~(std > 0)] = 1.0  # 全チーム同じ値 (または全て欠損) の指標は距離に影響させない
+        self.z = np.nan_to_num((values - mean) / std).astype(np.float32)
+        self.sq_norms = np.einsum('ij,ij->i', self.z, self.z)
+        norms = np.sqrt(self.sq_norms)
+        self.unit = self.z / np.where(norms > 0, norms, 1.0)[:, None]
+
+    def __sizeof__(self):
+        # 結果キャッシュのメモリ計算用
+        return object.__sizeof__(self) + self.z.nbytes + self.unit.nbytes + self.sq_norms.nbytes
+
+    def distances(self, label: str, metric: str) -> np.ndarray:
+        """label と全行との距離 (cosine は 1 - コサイン類似度)"""
+        i = self.label_index[label]
+        if metric == 'cosine':
+            return 1.0 - self.unit @ self.unit[i]
+        distances = np.sqrt(np.maximum(self.sq_norms + self.sq_norms[i] - 2.0 * (self.z @ self.z[i]), 0.0))
+        distances[i] = 0.0  # |a|^2 + |b|^2 - 2a・b は自分自身との距離でも丸め誤差が残る
+        return distances
+
+    def nearest(self, label: str, k: int, metric: str) -> tuple:
+        """label 自身を除く近い順の k 件の (位置, 距離)"""
+        distances = self.distances(label, metric)
+        distances[self.label_index[label]] = np.inf
+        k = min(k, len(distances) - 1)
+        if k <= 0:
+            return np.array([], dtype=np.int64), np.array([])
+        # 全件をソートせず、上位 k 件だけを取り出してから並べる
+        candidates = np.argpartition(distances, k - 1)[:k]
+        order = candidates[np.argsort(distances[candidates], kind='stable')]
+        return order, distances[order]
+
+    def pairwise(self, metric: str) -> np.ndarray:
+        """全ペアの行列 (cosine はコサイン類似度、euclidean は距離)"""
+        if metric == 'cosine':
+            return self.unit @ self.unit.T
+        gram = self.z @ self.z.T
+        distances = np.sqrt(np.maximum(self.sq_norms[:, None] + self.sq_norms[None, :] - 2.0 * gram, 0.0))
+        np.fill_diagonal(distances, 0.0)
+        return distances
+
+
+@budget_cached('profile_matrix')
+def get_profile_matrix(overview_key: tuple) -> ProfileMatrix:
+    """HOME画面のチーム別平均 (全リーグ) から標準化済みのプロファイル行列を作る (データのバージョンごとに1度だけ)"""
+    overview = get_league_overview(*overview_key)
+    metrics = [v for v in available_vars if v in overview.columns]
+    return ProfileMatrix(overview['Team'].tolist(), overview['League'].tolist(), metrics, overview[metrics].to_numpy())
+
+
+@instrumented(cached=True)
+@budget_cached('team_similarity')
+def get_similar_teams(overview_key: tuple, team: str, k: int, metric: str) -> pd.DataFrame:
+    """team に近い k チームの表 (近い順)"""
+    mark_cache_miss()
+    profiles = get_profile_matrix(overview_key)
+    positions, distances = profiles.nearest(team, k, metric)
+    label = next(name for name, value in SIMILARITY_METRICS.items() if value == metric)
+    return pd.DataFrame({
+        '順位': np.arange(1, len(positions) + 1),
+        'Team': [profiles.labels[i] for i in positions],
+        'League': [profiles.groups[i] for i in positions],
+        label: 1.0 - distances if metric == 'cosine' else distances,
+    })
+
+
+@instrumented(cached=True)
+@budget_cached('similarity_heatmap')
+def get_similarity_heatmap_spec(overview_key: tuple, metric: str) -> dict:
+    """全チームのペアの類似度/距離のヒートマップのspec (リーグ・チーム名順)"""
+    mark_cache_miss()
+    profiles = get_profile_matrix(overview_key)
+    order = sorted(range(len(profiles.labels)), key=lambda i: (profiles.groups[i], profiles.labels[i]))
+    matrix = profiles.pairwise(metric)[np.ix_(order, order)]
+    names = [profiles.labels[i] for i in order]
+    label = next(name for name, value in SIMILARITY_METRICS.items() if value == metric)
+    fig = go.Figure(go.Heatmap(
+        z=np.round(matrix, 3), x=names, y=names,
+        colorscale='RdBu' if metric == 'cosine' else 'Viridis_r',
+        zmid=0 if metric == 'cosine' else None,
+        colorbar=dict(title=label),
+        hovertemplate=f"%{{y}} × %{{x}}<br>{label}: %{{z:.3f}}<extra></extra>",
+    ))
+    fig.update_layout(title=f'全チームの{label} (標準化した {len(profiles.metrics)} 指標)', height=900,
+                      xaxis=dict(tickfont=dict(size=8)), yaxis=dict(tickfont=dict(size=8), autorange='reversed'))
+    return json.loads(fig.to_json())
+
+
+@instrumented()
+def render_team_similarity(team_avg_df: pd.DataFrame, overview_key: tuple):
+    """フィジカルの傾向 (全指標のチーム平均を標準化したプロファイル) が似ているチームを探す"""
+    st.markdown("### 🔎 チーム類似度：走り方が似ているチーム")
+    all_teams = sorted(team_avg_df['Team'].unique().tolist())
+    col1, col2, col3 = st.columns([2, 2, 1])
+    with col1:
+        default_index = all_teams.index('Cerezo Osaka') if 'Cerezo Osaka' in all_teams else 0
+        team = st.selectbox('基準のチーム', all_teams, index=default_index, key='similarity_team_home')
+    with col2:
+        metric_label = st.radio('距離の尺度', list(SIMILARITY_METRICS), index=0, key='similarity_metric_home', horizontal=True)
+    with col3:
+        k = st.number_input('表示するチーム数', min_value=1, max_value=max(len(all_teams) - 1, 1), value=min(5, max(len(all_teams) - 1, 1)),
+                            key='similarity_k_home')
+    metric = SIMILARITY_METRICS[metric_label]
+
+    similar = get_similar_teams(overview_key, team, int(k), metric)
+    st.dataframe(similar.style.format({metric_label: '{:.3f}'}), hide_index=True, use_container_width=True)
+
+    if len(team_avg_df) <= SIMILARITY_HEATMAP_MAX_ROWS:
+        st.plotly_chart(get_similarity_heatmap_spec(overview_key, metric), use_container_width=True)
+    else:
+        st.caption(f"対象が {SIMILARITY_HEATMAP_MAX_ROWS} 件を超えるため、全ペアのヒートマップは表示しません。")
 
 
 # render_trend_analysis関数
-def render_trend_analysis(df: pd.DataFrame, league_name: str, team_colors: dict, available_vars: list):
+@instrumented()
+def render_trend_analysis(df: pd.DataFrame, league_name: str, team_colors: dict, available_vars: list, trend_array: TrendArray = None):
     """チームごとのシーズン動向を節ベースで分析する折れ線グラフを描画する (対戦相手比較機能付き)"""
     st.markdown(f"### 📈 シーズン動向分析 ({league_name})")
     
@@ -340,55 +2058,49 @@ def render_trend_analysis(df: pd.DataFrame, league_name: str, team_colors: dict,
         st.error("⚠️ データに **'Matchday'** (節) 列が見つからないか、データが不完全です。データロード関数を確認してください。")
         return
 
+    if trend_array is None:
+        trend_array = build_trend_array(build_match_table(df))
+
     # 1. UI要素の定義 (チーム選択と分析項目選択)
-    all_teams = sorted(df['Team'].unique().tolist())
+    all_teams = trend_array.teams
     col1, col2 = st.columns(2)
     with col1:
         selected_team = st.selectbox('チームを選択', all_teams, key=f'trend_team_{league_name}')
     with col2:
-        selected_var = st.selectbox('分析したい項目を選択', available_vars, key=f'trend_var_{league_name}')
+        selected_var = st.selectbox('分析したい項目を選択', [v for v in available_vars if v in trend_array.metric_index], key=f'trend_var_{league_name}')
     
     # 条件ボタンの追加
-    show_opponent = st.checkbox('対戦相手のデータも表示する', key=f'show_opponent_{league_name}') 
+    col3, col4 = st.columns(2)
+    with col3:
+        show_opponent = st.checkbox('対戦相手のデータも表示する', key=f'show_opponent_{league_name}') 
+    with col4:
+        show_league_average = st.checkbox('リーグ平均を表示する', key=f'show_league_average_{league_name}')
+    compare_teams = st.multiselect('比較するチーム', [t for t in all_teams if t != selected_team], key=f'trend_compare_{league_name}')
+
+    if selected_team is None:
+        st.warning("チームのデータが見つかりません。")
+        return
 
-    # 2. 自チームデータ準備
-    team_data = df[df['Team'] == selected_team].copy()
-    
-    # 節ごとの平均値を計算 (自チーム): MatchdayとMatch IDでグループ化することで、1試合1行に集約
-    team_match_df = team_data.groupby(['Matchday', 'Match ID'])[selected_var].mean().reset_index()
-    team_match_df = team_match_df.rename(columns={selected_var: f'{selected_var} (自チーム)'})
+    # 2. 自チームデータ準備: 配列から (チーム, 全節, 指標) を切り出すだけ
+    matchdays = trend_array.matchdays
+    team_values = trend_array.series(selected_team, selected_var)
+    played = ~np.isnan(team_values)
+    team_match_df = pd.DataFrame({'Matchday': matchdays[played], f'{selected_var} (自チーム)': team_values[played]})
 
     if team_match_df.empty:
         st.warning(f"{selected_team} のデータが見つかりません。")
         return
 
-    # 3. 対戦相手データ準備 (条件がONの場合)
+    # 3. 対戦相手データ準備 (条件がONの場合): 対戦相手の位置で同じ配列を参照する
     opponent_match_df = None
     if show_opponent:
-        # 全データから自チームの試合IDリストを取得
-        match_ids = team_match_df['Match ID'].unique()
-        
-        # 自チームの試合に限定し、かつ自チームではない行を抽出（=対戦相手のデータ）
-        opponent_data = df[df['Match ID'].isin(match_ids) & (df['Team'] != selected_team)].copy()
-        
-        if not opponent_data.empty:
-            # MatchdayとMatch IDの対応表を作成 (Matchday -> Match ID -> 1:1を保証)
-            matchday_map = team_match_df[['Matchday', 'Match ID']].drop_duplicates()
-            
-            # 対戦相手のMatch IDごとの平均値を計算 (Match IDごとに1行に集約)
-            opponent_avg_df = opponent_data.groupby('Match ID').agg(
-                {selected_var: 'mean', 'Team': 'first'} # Team:firstで、そのMatch IDにおける対戦相手チーム名を取得
-            ).reset_index()
-            
-            # Matchdayをマッピング
-            opponent_match_df = pd.merge(opponent_avg_df, matchday_map, on='Match ID', how='left')
-            
-            # グラフ用のデータフレームに整理
-            opponent_match_df = opponent_match_df.rename(columns={selected_var: f'{selected_var} (対戦相手)'})
-            
-            # 念のためMatchdayとMatch IDをキーに重複を確認し、ソート
-            opponent_match_df = opponent_match_df.sort_values('Matchday').drop_duplicates(subset=['Matchday', 'Match ID'], keep='first')
-            opponent_match_df = opponent_match_df.sort_values(by='Matchday')
+        opponent_names, opponent_values = trend_array.opponent_series(selected_team, selected_var)
+        has_opponent = ~np.isnan(opponent_values)
+        opponent_match_df = pd.DataFrame({
+            'Team': opponent_names[has_opponent],
+            'Matchday': matchdays[has_opponent],
+            f'{selected_var} (対戦相手)': opponent_values[has_opponent],
+        })
 
 
     # 4. Plotly Graph Objectsで折れ線グラフ描画
@@ -430,6 +2142,33 @@ def render_trend_analysis(df: pd.DataFrame, league_name: str, team_colors: dict,
         ))
     
 
+    # --- 比較チームとリーグ平均 (同じ配列から切り出すだけで追加の集計は不要) ---
+    for compare_team in compare_teams:
+        compare_values = trend_array.series(compare_team, selected_var)
+        compare_played = ~np.isnan(compare_values)
+        fig.add_trace(go.Scatter(
+            x=matchdays[compare_played],
+            y=compare_values[compare_played],
+            mode='lines+markers',
+            name=compare_team,
+            line=dict(color=team_colors.get(compare_team, '#999999'), width=1.5),
+            marker=dict(size=5),
+            opacity=0.8,
+            hovertemplate=f"<b>節 %{{x}}</b>: %{{y:.2f}}<extra>{compare_team}</extra>",
+        ))
+
+    if show_league_average:
+        league_average = trend_array.league_average(selected_var)
+        has_average = ~np.isnan(league_average)
+        fig.add_trace(go.Scatter(
+            x=matchdays[has_average],
+            y=league_average[has_average],
+            mode='lines',
+            name=f'{league_name} 平均',
+            line=dict(color='#4A2E19', width=2, dash='dash'),
+            hovertemplate=f"<b>節 %{{x}}</b>: %{{y:.2f}}<extra>{league_name} 平均</extra>",
+        ))
+
     # レイアウト設定
     title_text = f'**{selected_team}**: {selected_var} のシーズン推移'
     if show_opponent:
@@ -441,8 +2180,8 @@ def render_trend_analysis(df: pd.DataFrame, league_name: str, team_colors: dict,
         yaxis_title=f'{selected_var} (試合平均)',
         hovermode="x unified",
         height=550,
-        # X軸の範囲を [0, 39] に固定
-        xaxis=dict(range=[0, 39]) 
+        # X軸の範囲を [0, 39] に固定 (39節以上のデータがある場合は広げる)
+        xaxis=dict(range=[0, max(39, len(matchdays) + 1)]) 
     )
     # X軸の目盛りを整数にする
     fig.update_xaxes(dtick=1)
@@ -450,379 +2189,360 @@ def render_trend_analysis(df: pd.DataFrame, league_name: str, team_colors: dict,
     st.plotly_chart(fig, use_container_width=True)
 
 
-# --- 3. メインロジック ---
+def render_season_comparison(df: pd.DataFrame, league_key: str, store: LeagueStore):
+    """シーズン間の比較を描画する (各シーズンは集計済みの構成要素だけを読み込む)"""
+    st.markdown("### 📅 シーズン比較")
+    seasons = [season for season, league_keys in scan_data_catalog().items() if league_key in league_keys]
+    if len(seasons) < 2:
+        st.info(f"{league_key} は比較できる他のシーズンのデータがありません。")
+        return
 
-# サイドバーで選択と、その結果の変数 `selected` の取得のみを行う
-with st.sidebar:
-    st.subheader("menu")
-    selected = st.selectbox(' ',['HOME','J1','J2','J3'], key='league_selector')
-    
-# サイドバーの外で、選択に基づきデータをロード
-df = pd.DataFrame() 
-if selected in ['J1', 'J2', 'J3']:
-    df = get_data(selected) 
-elif selected == 'HOME':
-    df = get_all_league_data()
-else:
-    df = pd.DataFrame() 
-
-# --- 4. メインコンテンツの描画 ---
-
-if selected == 'HOME':
-    st.title('🇯🇵 J.League Data Dashboard: 全体分析')
-    st.markdown('サイドバーからリーグを選択して、フィジカルデータ分析ダッシュボードをご利用ください。')
-    
-    if df.empty:
-        st.warning("⚠️ J1, J2, J3 のいずれのデータもロードできなかったため、全体分析を表示できません。")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        selected_seasons = st.multiselect('比較するシーズン', seasons, default=seasons[:3], key=f"compare_seasons_{league_key}")
+    with col2:
+        ranking_method = st.selectbox('集計方法', RANKING_METHODS, key=f"compare_method_{league_key}")
+    with col3:
+        metric = st.selectbox('指標', available_vars, key=f"compare_var_{league_key}")
+    if not selected_seasons:
+        st.warning("シーズンを1つ以上選択してください。")
+        return
+
+    # 表示中のシーズンは追記分も含むストアの構成要素を使い、他のシーズンはパーティションの集計結果だけを読む
+    components_by_season = {
+        season: store.components() if season == store.season else get_partition_components(league_key, season)
+        for season in sorted(selected_seasons)
+    }
+    table = build_season_comparison(components_by_season, ranking_method, metric)
+    latest = str(max(selected_seasons))
+    table = table.sort_values(by=latest, ascending=ranking_method == 'Min', na_position='last')
+
+    chart_data = table.drop(columns='通算').reset_index().melt(id_vars='Team', var_name='Season', value_name=metric).dropna()
+    teams = table.index.tolist()
+    chart = alt.Chart(chart_data).mark_line(point=True).encode(
+        x=alt.X('Season:O', title='シーズン'),
+        y=alt.Y(f'{metric}:Q', title=f'{ranking_method} {metric}', scale=alt.Scale(zero=False)),
+        color=alt.Color('Team:N', scale=alt.Scale(domain=teams, range=[TEAM_COLORS.get(team, '#888888') for team in teams])),
+        tooltip=['Team', 'Season', alt.Tooltip(f'{metric}:Q', format=',.2f')],
+    ).properties(height=500)
+    st.altair_chart(chart, use_container_width=True)
+    st.dataframe(table.style.format('{:,.2f}', na_rep='-'), use_container_width=True)
+
+
+# --- チームプロファイル (全指標のパーセンタイル順位とZスコア) ---
+PROFILE_SCOPES = ['リーグ内', '全リーグ'] # 順位を比べる範囲
+STANDING_STATS = {'パーセンタイル': 'Percentile', 'Zスコア': 'Z'}
+
+
+def build_standing_matrix(values: pd.DataFrame) -> pd.DataFrame:
+    """(League, Team) × 指標の値から、全指標のパーセンタイル順位 (0–100) とZスコアを列ごとの一括演算で求める
+
+    列は (Stat, Metric) の2段。欠損値は順位・平均・標準偏差の計算から除く。
+    """
+    percentiles = values.rank(pct=True) * 100
+    array = values.to_numpy(dtype=np.float64)
+    mean = np.nanmean(array, axis=0)
+    std = np.nanstd(array, axis=0)
+    z = np.divide(array - mean, std, out=np.zeros_like(array), where=std > 0)
+    z[np.isnan(array)] = np.nan
+    zscores = pd.DataFrame(z, index=values.index, columns=values.columns)
+    return pd.concat([percentiles, zscores], axis=1, keys=list(STANDING_STATS.values()), names=['Stat', 'Metric'])
+
+
+@instrumented(cached=True)
+@budget_cached('standing_matrix')
+def get_standing_matrix(season: int, versions: tuple, ranking_method: str) -> pd.DataFrame:
+    """versions のリーグを母集団にしたパーセンタイル・Zスコアの行列 (データのバージョンと集計方法ごとに1度だけ計算する)"""
+    mark_cache_miss()
+    cubes = {league_key: get_league_store(league_key, season).cube() for league_key, _ in versions}
+    values = pd.concat({league_key: cube[ranking_method] for league_key, cube in cubes.items() if not cube.empty}, names=['League', 'Team'])
+    return build_standing_matrix(values[[v for v in available_vars if v in values.columns]])
+
+
+@instrumented(cached=True)
+@budget_cached('profile_chart')
+def get_profile_chart_spec(season: int, versions: tuple, ranking_method: str, stat: str, league_key: str, teams: tuple) -> dict:
+    """選択したチームのプロファイルのグラフのspec (パーセンタイルはレーダーチャート、Zスコアは横棒グラフ)"""
+    mark_cache_miss()
+    table = get_standing_matrix(season, versions, ranking_method)[stat].xs(league_key, level='League')
+    metrics = table.columns.tolist()
+    fig = go.Figure()
+    for team in teams:
+        values = table.loc[team].to_numpy()
+        color = TEAM_COLORS.get(team, '#888888')
+        if stat == 'Percentile':
+            # 最初の指標に戻って輪を閉じる
+            fig.add_trace(go.Scatterpolar(r=[*values, values[0]], theta=[*metrics, metrics[0]], name=team, fill='toself', opacity=0.6,
+                                          line=dict(color=color), hovertemplate='%{theta}: %{r:.0f}<extra>' + team + '</extra>'))
+        else:
+            fig.add_trace(go.Bar(x=values, y=metrics, orientation='h', name=team, marker_color=color,
+                                 hovertemplate='%{y}: %{x:.2f}<extra>' + team + '</extra>'))
+    if stat == 'Percentile':
+        fig.update_layout(polar=dict(radialaxis=dict(range=[0, 100])), height=650)
     else:
-        Scatter_tab, Preview_tab = st.tabs(['散布図分析', 'データプレビュー'])
+        fig.update_layout(barmode='group', xaxis_title='Zスコア', yaxis=dict(autorange='reversed'), height=650)
+    return json.loads(fig.to_json())
 
-        with Scatter_tab:
-            render_scatter_plot(df, available_vars, TEAM_COLORS, LEAGUE_COLOR_MAP)
 
-        with Preview_tab:
-            st.subheader("全リーグデータプレビュー")
-            st.dataframe(df.head())
-            st.markdown(f"**ロードされたチーム数:** {df['Team'].nunique()} | **ロードされたデータ行数:** {len(df)}")
+@instrumented()
+def render_team_profile(df: pd.DataFrame, league_key: str, store: LeagueStore):
+    """全指標の順位を1画面で比べるプロファイル (指標を1つずつ切り替えなくてよい)"""
+    st.markdown("### 🧭 チームプロファイル")
+    teams = store.cube().index.tolist()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        ranking_method = st.selectbox('集計方法', RANKING_METHODS, index=RANKING_METHODS.index('Average'), key=f"profile_method_{league_key}")
+    with col2:
+        scope = st.radio('比較する範囲', PROFILE_SCOPES, key=f"profile_scope_{league_key}", horizontal=True)
+    with col3:
+        stat_label = st.radio('指標の尺度', list(STANDING_STATS), key=f"profile_stat_{league_key}", horizontal=True)
+    selected_teams = st.multiselect('チーム (最大4)', teams, default=teams[:1], max_selections=4, key=f"profile_teams_{league_key}")
+    stat = STANDING_STATS[stat_label]
+
+    if scope == PROFILE_SCOPES[0]:
+        versions = ((league_key, store.version),)
+    else:
+        versions = league_store_versions(load_all_league_stores(store.season))
+    if selected_teams:
+        st.plotly_chart(get_profile_chart_spec(store.season, versions, ranking_method, stat, league_key, tuple(selected_teams)),
+                        use_container_width=True)
+    # 列見出しのクリックで並べ替えられる表
+    table = get_standing_matrix(store.season, versions, ranking_method)[stat].xs(league_key, level='League')
+    st.dataframe(table.round(1 if stat == 'Percentile' else 2), use_container_width=True)
+
+
+# --- リーグページのビューモデル (段階ごとに、依存するデータのバージョンとウィジェットの値をキーにメモ化) ---
+@budget_cached('team_color_domain')
+def get_team_color_domain(league_key: str, season: int, data_version: int) -> tuple:
+    """リーグに登場するチームの (Altairのカラードメイン, カラーレンジ) を返す"""
+    current_teams = get_league_store(league_key, season).frame['Team'].unique().tolist()
+    filtered_colors = {team: TEAM_COLORS[team] for team in current_teams if team in TEAM_COLORS}
+    return list(filtered_colors.keys()), list(filtered_colors.values())
+
+
+@instrumented(cached=True)
+@budget_cached('ranking_view')
+def get_ranking_view(league_key: str, season: int, data_version: int, ranking_method: str, selected_ranking_var: str) -> tuple:
+    """集計ランキングのビューモデル (km換算・ソート済みのグラフ用データ, 並べ替えに使う列名, 昇順かどうか, ツールチップの書式)"""
+    mark_cache_miss()
+    actual_var = selected_ranking_var.replace(' (km)', '')
+    team_stats_aggregated = get_aggregate_cube(league_key, season)[ranking_method][[actual_var]].reset_index()
+    return build_ranking_plot_data(team_stats_aggregated, ranking_method, selected_ranking_var)
+
+
+def build_ranking_chart_spec(ranking_view: tuple, color_domain: tuple, ranking_method: str, selected_ranking_var: str) -> dict:
+    """集計ランキングの棒グラフのspec (Vega-Lite)。データはエンコードする Team と指標の列だけに絞る"""
+    plot_data, var_to_rank, sort_ascending, tooltip_format = ranking_view
+    domain_list, range_list = color_domain
+    chart = alt.Chart(plot_data[['Team', var_to_rank]]).mark_bar().encode(
+        y=alt.Y('Team:N', sort=alt.EncodingSortField(
+            field=var_to_rank, op='sum', order='descending' if not sort_ascending else 'ascending'
+        ), title='チーム'),
+        x=alt.X(f'{var_to_rank}:Q', title=f'{ranking_method} {selected_ranking_var}'),
+        color=alt.Color('Team:N', scale=alt.Scale(domain=domain_list, range=range_list)),
+        tooltip=['Team', alt.Tooltip(var_to_rank, format=tooltip_format, title=selected_ranking_var)]
+    ).properties(height=600)
+    return chart.to_dict()
+
+
+@instrumented(cached=True)
+@budget_cached('ranking_spec')
+def get_ranking_chart_spec(league_key: str, season: int, data_version: int, ranking_method: str, selected_ranking_var: str) -> dict:
+    """集計ランキングのグラフのspec (リーグ・集計方法・指標とデータのバージョンごとに1度だけ作る)"""
+    mark_cache_miss()
+    return build_ranking_chart_spec(
+        get_ranking_view(league_key, season, data_version, ranking_method, selected_ranking_var),
+        get_team_color_domain(league_key, season, data_version),
+        ranking_method, selected_ranking_var,
+    )
 
 
-# ------------------------------------
-# J1 リーグのコンテンツ
-# ------------------------------------
-if selected == 'J1':
-    
-    if df.empty:
-        st.warning("データがロードされていないため、J1スタッツを表示できません。")
-    else:
-        st.header(f"🏆 J1 リーグ分析ダッシュボード")
-        
-        current_teams = df['Team'].unique().tolist()
-        filtered_colors = {team: TEAM_COLORS[team] for team in current_teams if team in TEAM_COLORS}
-        domain_list = list(filtered_colors.keys())
-        range_list = list(filtered_colors.values())
-        
-        Aggregate_Ranking_tab, Custom_tab, Trend_tab = st.tabs(['集計ランキング', 'カスタムランキング', 'シーズン動向分析'])
-        
-        try:
-            with Aggregate_Ranking_tab:
-                
-                st.markdown("### 📊 チーム別 ランキング")
-
-                # ★ 集計方法の選択を追加
-                col_agg, col_var = st.columns(2)
-                with col_agg:
-                    ranking_method = st.selectbox(
-                        '集計方法を選択', 
-                        options=RANKING_METHODS, 
-                        index=0, 
-                        key='J1_ranking_method'
-                    )
-                
-                # 'Distance'を'Distance (km)'に置き換えた表示用リストを作成
-                ranking_options = [v.replace('Distance', 'Distance (km)') if v == 'Distance' and ranking_method == 'Total' else v for v in available_vars]
-
-                with col_var:
-                    selected_ranking_var = st.selectbox(
-                        '表示する指標を選択', 
-                        options=ranking_options, 
-                        index=0, 
-                        key='J1_ranking_var'
-                    )
-
-                # 実際に集計に使用する列名 (kmをmに戻す)
-                actual_var = selected_ranking_var.replace(' (km)', '')
-
-                # データ集計（選択された方法に応じて切り替え）
-                team_stats_aggregated = pd.DataFrame() # 初期化
-                
-                if actual_var in df.columns:
-                    if ranking_method == 'Total':
-                        team_stats_aggregated = df.groupby('Team')[available_vars].sum().reset_index()
-                    elif ranking_method == 'Average':
-                        team_stats_aggregated = df.groupby('Team')[available_vars].mean().reset_index()
-                    elif ranking_method == 'Max':
-                        team_stats_aggregated = df.groupby('Team')[available_vars].max().reset_index()
-                    elif ranking_method == 'Min':
-                        team_stats_aggregated = df.groupby('Team')[available_vars].min().reset_index()
-                    else:
-                        st.error("無効な集計方法が選択されました。")
-                        st.stop() # 修正: return -> st.stop()
-
-                    # グラフ描画用データフレームを準備
-                    plot_data = team_stats_aggregated.copy()
-                    
-                    # 選択された指標がDistanceで、集計方法がTotalの場合の調整
-                    if selected_ranking_var == 'Distance (km)':
-                        var_to_rank = 'Distance (km)'
-                        # Distanceをkmに変換
-                        plot_data[var_to_rank] = plot_data[actual_var] / 1000
-                        tooltip_format = '.1f'
-                        sort_ascending = False
-                    else:
-                        var_to_rank = actual_var
-                        # Minの場合は昇順
-                        sort_ascending = True if ranking_method == 'Min' else False
-                        tooltip_format = ',.0f' if ranking_method in ['Total', 'Max'] and 'Count' in var_to_rank else '.2f'
-
-                    # ランキングのソート
-                    plot_data = plot_data.sort_values(by=var_to_rank, ascending=sort_ascending).reset_index(drop=True)
-
-                    # Altair グラフ描画
-                    chart = alt.Chart(plot_data).mark_bar().encode(
-                        y=alt.Y('Team:N', sort=alt.EncodingSortField(
-                            field=var_to_rank, op='sum', order='descending' if not sort_ascending else 'ascending'
-                        ), title='チーム'),
-                        x=alt.X(f'{var_to_rank}:Q', title=f'{ranking_method} {selected_ranking_var}'),
-                        color=alt.Color('Team:N', scale=alt.Scale(domain=domain_list, range=range_list)),
-                        tooltip=['Team', alt.Tooltip(var_to_rank, format=tooltip_format, title=selected_ranking_var)]
-                    ).properties(height=600)
-                    st.altair_chart(chart, use_container_width=True)
-
-                    # Excelダウンロードボタン (描画に使ったデータフレームを使用)
-                    download_df = plot_data[['Team', var_to_rank]]
-                    st.download_button(
-                        label=f"{ranking_method} {selected_ranking_var} ランキングをExcelでダウンロード",
-                        data=to_excel(download_df),
-                        file_name=f'{selected}_{ranking_method}_{selected_ranking_var.replace(" ", "_")}_Ranking.xlsx',
-                        mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                    )
-                else:
-                     st.warning(f"データに '{actual_var}' の列が見つかりません。")
-                     st.stop() # 修正: エラー後の処理を中断
-                     
-
-        except KeyError as e:
-            st.error(f"J1データの集計に失敗しました。CSVファイルに必須の列が見つかりません: {e}")
-        except Exception as e:
-            st.error(f"J1で予期せぬエラーが発生しました: {e}")
-
-        with Custom_tab:
-            # Custom_tabの集計方法もRANKING_METHODSを使用するように変更
-            render_custom_ranking(df, 'J1', TEAM_COLORS, available_vars)
-        
-        # シーズン動向分析
-        with Trend_tab:
-            render_trend_analysis(df, 'J1', TEAM_COLORS, available_vars)
+@instrumented()
+def render_aggregate_ranking(df: pd.DataFrame, league_key: str, store: LeagueStore):
+    """チーム別の集計ランキング（Altair）を描画する"""
+    try:
+        st.markdown("### 📊 チーム別 ランキング")
+
+        # ★ 集計方法の選択を追加
+        col_agg, col_var = st.columns(2)
+        with col_agg:
+            ranking_method = st.selectbox(
+                '集計方法を選択', 
+                options=RANKING_METHODS, 
+                index=0, 
+                key=f'{league_key}_ranking_method'
+            )
 
+        # 'Distance'を'Distance (km)'に置き換えた表示用リストを作成
+        ranking_options = ranking_var_options(ranking_method)
 
-# ------------------------------------
-# J2 リーグのコンテンツ
-# ------------------------------------
-elif selected == 'J2':
-    
-    if df.empty:
-        st.warning(f"⚠️ {selected} リーグのデータがロードできませんでした。ファイルが存在するか確認してください。")
-    else:
-        st.header(f"🏆 J2 リーグ分析ダッシュボード")
+        with col_var:
+            selected_ranking_var = st.selectbox(
+                '表示する指標を選択', 
+                options=ranking_options, 
+                index=0, 
+                key=f'{league_key}_ranking_var'
+            )
 
-        current_teams = df['Team'].unique().tolist()
-        filtered_colors = {team: TEAM_COLORS[team] for team in current_teams if team in TEAM_COLORS}
-        domain_list = list(filtered_colors.keys())
-        range_list = list(filtered_colors.values())
-        
-        Aggregate_Ranking_tab, Custom_tab, Trend_tab = st.tabs(['集計ランキング', 'カスタムランキング', 'シーズン動向分析'])
-        
-        try:
-            with Aggregate_Ranking_tab:
-                
-                st.markdown("### 📊 チーム別 ランキング")
-
-                # ★ 集計方法の選択を追加
-                col_agg, col_var = st.columns(2)
-                with col_agg:
-                    ranking_method = st.selectbox(
-                        '集計方法を選択', 
-                        options=RANKING_METHODS, 
-                        index=0, 
-                        key='J2_ranking_method'
-                    )
-                
-                ranking_options = [v.replace('Distance', 'Distance (km)') if v == 'Distance' and ranking_method == 'Total' else v for v in available_vars]
-
-                with col_var:
-                    selected_ranking_var = st.selectbox(
-                        '表示する指標を選択', 
-                        options=ranking_options, 
-                        index=0, 
-                        key='J2_ranking_var'
-                    )
-
-                actual_var = selected_ranking_var.replace(' (km)', '')
-
-                # データ集計（選択された方法に応じて切り替え）
-                team_stats_aggregated = pd.DataFrame() # 初期化
-                
-                if actual_var in df.columns:
-                    if ranking_method == 'Total':
-                        team_stats_aggregated = df.groupby('Team')[available_vars].sum().reset_index()
-                    elif ranking_method == 'Average':
-                        team_stats_aggregated = df.groupby('Team')[available_vars].mean().reset_index()
-                    elif ranking_method == 'Max':
-                        team_stats_aggregated = df.groupby('Team')[available_vars].max().reset_index()
-                    elif ranking_method == 'Min':
-                        team_stats_aggregated = df.groupby('Team')[available_vars].min().reset_index()
-                    else:
-                        st.error("無効な集計方法が選択されました。")
-                        st.stop() # 修正: return -> st.stop()
-
-                    # グラフ描画用データフレームを準備
-                    plot_data = team_stats_aggregated.copy()
-                    
-                    if selected_ranking_var == 'Distance (km)':
-                        var_to_rank = 'Distance (km)'
-                        plot_data[var_to_rank] = plot_data[actual_var] / 1000
-                        tooltip_format = '.1f'
-                        sort_ascending = False
-                    else:
-                        var_to_rank = actual_var
-                        sort_ascending = True if ranking_method == 'Min' else False
-                        tooltip_format = ',.0f' if ranking_method in ['Total', 'Max'] and 'Count' in var_to_rank else '.2f'
-
-                    plot_data = plot_data.sort_values(by=var_to_rank, ascending=sort_ascending).reset_index(drop=True)
-
-                    # Altair グラフ描画
-                    chart = alt.Chart(plot_data).mark_bar().encode(
-                        y=alt.Y('Team:N', sort=alt.EncodingSortField(
-                            field=var_to_rank, op='sum', order='descending' if not sort_ascending else 'ascending'
-                        ), title='チーム'),
-                        x=alt.X(f'{var_to_rank}:Q', title=f'{ranking_method} {selected_ranking_var}'),
-                        color=alt.Color('Team:N', scale=alt.Scale(domain=domain_list, range=range_list)),
-                        tooltip=['Team', alt.Tooltip(var_to_rank, format=tooltip_format, title=selected_ranking_var)]
-                    ).properties(height=600)
-                    st.altair_chart(chart, use_container_width=True)
-
-                    # Excelダウンロードボタン
-                    download_df = plot_data[['Team', var_to_rank]]
-                    st.download_button(
-                        label=f"{ranking_method} {selected_ranking_var} ランキングをExcelでダウンロード",
-                        data=to_excel(download_df),
-                        file_name=f'{selected}_{ranking_method}_{selected_ranking_var.replace(" ", "_")}_Ranking.xlsx',
-                        mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                    )
-                else:
-                     st.warning(f"データに '{actual_var}' の列が見つかりません。")
-                     st.stop() # 修正: エラー後の処理を中断
+        # 実際に集計に使用する列名 (kmをmに戻す)
+        actual_var = selected_ranking_var.replace(' (km)', '')
 
-        except KeyError as e:
-            st.error(f"J2データの集計に失敗しました。CSVファイルに必須の列が見つかりません: {e}")
-        except Exception as e:
-            st.error(f"J2で予期せぬエラーが発生しました: {e}")
+        if actual_var in df.columns:
+            if ranking_method not in RANKING_METHODS:
+                st.error("無効な集計方法が選択されました。")
+                st.stop() # 修正: return -> st.stop()
 
-        with Custom_tab:
-            render_custom_ranking(df, 'J2', TEAM_COLORS, available_vars)
+            # Altair グラフ描画 (specはリーグ・集計方法・指標ごとにキャッシュ)
+            st.vega_lite_chart(get_ranking_chart_spec(league_key, store.season, store.version, ranking_method, selected_ranking_var),
+                               use_container_width=True)
 
-        # シーズン動向分析
-        with Trend_tab:
-            render_trend_analysis(df, 'J2', TEAM_COLORS, available_vars)
+            # Excelダウンロードボタン (押された時だけxlsxを生成し、リーグ・集計方法・指標ごとにキャッシュ)
+            st.download_button(
+                label=f"{ranking_method} {selected_ranking_var} ランキングをExcelでダウンロード",
+                data=functools.partial(get_ranking_excel, league_key, store.season, store.version, ranking_method, selected_ranking_var),
+                file_name=f'{store.season}_{league_key}_{ranking_method}_{selected_ranking_var.replace(" ", "_")}_Ranking.xlsx',
+                mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            )
+            # リーグ全体 (全集計方法×全指標) のランキングを1つのブックにまとめてダウンロード
+            st.download_button(
+                label=f"{league_key} 全ランキング (全集計方法×全指標) をExcelでダウンロード",
+                data=functools.partial(get_league_workbook, league_key, store.season, store.version),
+                file_name=f'{store.season}_{league_key}_All_Rankings.xlsx',
+                mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            )
+        else:
+             st.warning(f"データに '{actual_var}' の列が見つかりません。")
+             st.stop() # 修正: エラー後の処理を中断
 
+    except KeyError as e:
+        st.error(f"{league_key}データの集計に失敗しました。CSVファイルに必須の列が見つかりません: {e}")
+    except Exception as e:
+        st.error(f"{league_key}で予期せぬエラーが発生しました: {e}")
 
-# ------------------------------------
-# J3 リーグのコンテンツ
-# ------------------------------------
-elif selected == 'J3':
-    
-    if df.empty:
-        st.warning(f"⚠️ {selected} リーグのデータがロードできませんでした。ファイルが存在するか確認してください。")
-    else:
-        st.header(f"🏆 J3 リーグ分析ダッシュボード")
-        
-        current_teams = df['Team'].unique().tolist()
-        filtered_colors = {team: TEAM_COLORS[team] for team in current_teams if team in TEAM_COLORS}
-        domain_list = list(filtered_colors.keys())
-        range_list = list(filtered_colors.values())
-        
-        Aggregate_Ranking_tab, Custom_tab, Trend_tab = st.tabs(['集計ランキング', 'カスタムランキング', 'シーズン動向分析'])
-        
-        try:
-            with Aggregate_Ranking_tab:
-                
-                st.markdown("### 📊 チーム別 ランキング")
-
-                # ★ 集計方法の選択を追加
-                col_agg, col_var = st.columns(2)
-                with col_agg:
-                    ranking_method = st.selectbox(
-                        '集計方法を選択', 
-                        options=RANKING_METHODS, 
-                        index=0, 
-                        key='J3_ranking_method'
-                    )
-                
-                ranking_options = [v.replace('Distance', 'Distance (km)') if v == 'Distance' and ranking_method == 'Total' else v for v in available_vars]
-
-                with col_var:
-                    selected_ranking_var = st.selectbox(
-                        '表示する指標を選択', 
-                        options=ranking_options, 
-                        index=0, 
-                        key='J3_ranking_var'
-                    )
-
-                actual_var = selected_ranking_var.replace(' (km)', '')
-                
-                # データ集計（選択された方法に応じて切り替え）
-                team_stats_aggregated = pd.DataFrame() # 初期化
-                
-                if actual_var in df.columns:
-                    if ranking_method == 'Total':
-                        team_stats_aggregated = df.groupby('Team')[available_vars].sum().reset_index()
-                    elif ranking_method == 'Average':
-                        team_stats_aggregated = df.groupby('Team')[available_vars].mean().reset_index()
-                    elif ranking_method == 'Max':
-                        team_stats_aggregated = df.groupby('Team')[available_vars].max().reset_index()
-                    elif ranking_method == 'Min':
-                        team_stats_aggregated = df.groupby('Team')[available_vars].min().reset_index()
-                    else:
-                        st.error("無効な集計方法が選択されました。")
-                        st.stop() # 修正: return -> st.stop()
-
-                    # グラフ描画用データフレームを準備
-                    plot_data = team_stats_aggregated.copy()
-                    
-                    if selected_ranking_var == 'Distance (km)':
-                        var_to_rank = 'Distance (km)'
-                        plot_data[var_to_rank] = plot_data[actual_var] / 1000
-                        tooltip_format = '.1f'
-                        sort_ascending = False
-                    else:
-                        var_to_rank = actual_var
-                        sort_ascending = True if ranking_method == 'Min' else False
-                        tooltip_format = ',.0f' if ranking_method in ['Total', 'Max'] and 'Count' in var_to_rank else '.2f'
-
-                    plot_data = plot_data.sort_values(by=var_to_rank, ascending=sort_ascending).reset_index(drop=True)
-
-                    # Altair グラフ描画
-                    chart = alt.Chart(plot_data).mark_bar().encode(
-                        y=alt.Y('Team:N', sort=alt.EncodingSortField(
-                            field=var_to_rank, op='sum', order='descending' if not sort_ascending else 'ascending'
-                        ), title='チーム'),
-                        x=alt.X(f'{var_to_rank}:Q', title=f'{ranking_method} {selected_ranking_var}'),
-                        color=alt.Color('Team:N', scale=alt.Scale(domain=domain_list, range=range_list)),
-                        tooltip=['Team', alt.Tooltip(var_to_rank, format=tooltip_format, title=selected_ranking_var)]
-                    ).properties(height=600)
-                    st.altair_chart(chart, use_container_width=True)
-
-                    # Excelダウンロードボタン
-                    download_df = plot_data[['Team', var_to_rank]]
-                    st.download_button(
-                        label=f"{ranking_method} {selected_ranking_var} ランキングをExcelでダウンロード",
-                        data=to_excel(download_df),
-                        file_name=f'{selected}_{ranking_method}_{selected_ranking_var.replace(" ", "_")}_Ranking.xlsx',
-                        mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                    )
-                else:
-                     st.warning(f"データに '{actual_var}' の列が見つかりません。")
-                     st.stop() # 修正: エラー後の処理を中断
 
+# --- タブごとのフラグメント (タブ内のウィジェット操作ではそのタブだけを再実行する) ---
+LEAGUE_TABS = {
+    '集計ランキング': render_aggregate_ranking,
+    'カスタムランキング': lambda df, league_key, store: render_custom_ranking(df, league_key, TEAM_COLORS, available_vars, store.cube(), store.version,
+                                                                         store.artifacts()),
+    'シーズン動向分析': lambda df, league_key, store: render_trend_analysis(df, league_key, TEAM_COLORS, available_vars, store.trend_array()),
+    'シーズン比較': render_season_comparison,
+    'プロファイル': render_team_profile,
+}
 
-        except KeyError as e:
-            st.error(f"J3データの集計に失敗しました。CSVファイルに必須の列が見つかりません: {e}")
-        except Exception as e:
-            st.error(f"J3で予期せぬエラーが発生しました: {e}")
 
-        with Custom_tab:
-            render_custom_ranking(df, 'J3', TEAM_COLORS, available_vars)
+@st.fragment
+def render_league_tab(league_key: str, season: int, tab_name: str):
+    """リーグページの1つのタブを描画し、描画時間を記録する"""
+    script_run_ctx = get_script_run_ctx(suppress_warning=True)
+    fragment_rerun = script_run_ctx is not None and bool(getattr(script_run_ctx, 'fragment_ids_this_run', None))
+    if fragment_rerun:
+        begin_perf_run('fragment')
+    start = time.perf_counter()
+    store = get_league_store(league_key, season)
+    LEAGUE_TABS[tab_name](store.frame, league_key, store)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    timings = st.session_state.setdefault('tab_render_ms', {})
+    timings[(league_key, tab_name)] = elapsed_ms
+    fields = {}
+    if fragment_rerun:
+        # フラグメントだけの再実行: 他のタブの直近の描画時間が、全体再実行と比べて省略できた時間
+        fields['skipped_ms'] = round(sum(ms for (key, name), ms in timings.items() if key == league_key and name != tab_name), 3)
+    log_perf(f'tab:{league_key}:{tab_name}', ms=round(elapsed_ms, 3), **fields)
+    if fragment_rerun and st.session_state.get('perf_debug'):
+        # サイドバーのパネルはフラグメントの再実行では更新されないため、このタブの再実行の結果はここに表示する
+        with st.expander(f"🛠 このタブの再実行 #{st.session_state['perf_run_id']} の計測", expanded=True):
+            render_perf_records(st.session_state['perf_records'])
+
+
+def render_store_notices(store: LeagueStore):
+    """ストアのロード時の状態 (失敗・節の生成) を表示する。キャッシュしたロード関数の外で、再実行ごとに1度だけ呼ぶ"""
+    if store.load_error:
+        st.error(store.load_error)
+    if store.matchday_generated:
+        st.warning(f"⚠️ {store.league_key}データに正確な時系列情報がなく、節 ('Matchday') の生成が不正確になる可能性があります。")
+
+
+def render_league_page(league_key: str, season: int):
+    """1リーグ・1シーズン分のページ (ヘッダーと各タブ) を描画する。リーグは LEAGUE_FILE_MAP に追加するだけで増やせる"""
+    # ローディングインジケータを表示 (Streamlit Cloudで役立つ)
+    with st.spinner(f'{season} {league_key}データをロード中...'):
+        store = get_league_store(league_key, season)
+    render_store_notices(store)
+    if store.frame.empty:
+        st.warning(f"⚠️ {season} {league_key} リーグのデータがロードできませんでした。ファイルが存在するか確認してください。")
+        return
+
+    st.header(f"🏆 {season} {league_key} リーグ分析ダッシュボード")
+    if store.refreshing:
+        st.caption("🔄 データを更新しています。完了するまでは前回のデータを表示します。")
+
+    # タブごとにフラグメント化し、タブ内のウィジェット操作ではそのタブだけを再実行する
+    tab_containers = st.tabs(list(LEAGUE_TABS))
+    for tab_container, tab_name in zip(tab_containers, LEAGUE_TABS):
+        with tab_container:
+            render_league_tab(league_key, season, tab_name)
+
+
+def render_app():
+    st.subheader('All data by SkillCorner')
+
+    # --- 3. メインロジック ---
+
+    # サイドバーで選択と、その結果の変数 `selected` の取得のみを行う
+    with st.sidebar:
+        st.subheader("menu")
+        season = st.selectbox('シーズン', available_seasons(), key='season_selector')
+        selected = st.selectbox(' ', ['HOME', *scan_data_catalog().get(season, LEAGUE_FILE_MAP)], key='league_selector')
+
+    # --- 4. メインコンテンツの描画 ---
+
+    if selected == 'HOME':
+        stores = load_all_league_stores(season)
+        for store in stores.values():
+            render_store_notices(store)
+        overview_key = (season, league_store_versions(stores))
+        overview = get_league_overview(*overview_key)
+        st.title('🇯🇵 J.League Data Dashboard: 全体分析')
+        st.markdown('サイドバーからリーグを選択して、フィジカルデータ分析ダッシュボードをご利用ください。')
+
+        if overview.empty:
+            st.warning(f"⚠️ {', '.join(LEAGUE_FILE_MAP)} のいずれのデータもロードできなかったため、全体分析を表示できません。")
+        else:
+            Scatter_tab, Similarity_tab, Preview_tab = st.tabs(['散布図分析', 'チーム類似度', 'データプレビュー'])
+
+            with Scatter_tab:
+                render_scatter_plot(overview, overview_key, available_vars)
+
+            with Similarity_tab:
+                render_team_similarity(overview, overview_key)
+
+            with Preview_tab:
+                # 全リーグを結合したフレームは作らず、各リーグのストアのフレームを参照する
+                frames = [store.frame for store in stores.values()]
+                st.subheader("全リーグデータプレビュー")
+                st.dataframe(next(frame for frame in frames if not frame.empty).head())
+                st.markdown(f"**ロードされたチーム数:** {overview['Team'].nunique()} | **ロードされたデータ行数:** {sum(len(frame) for frame in frames)}")
+
+    # ------------------------------------
+    # 各リーグのコンテンツ
+    # ------------------------------------
+    elif selected in LEAGUE_FILE_MAP:
+        render_league_page(selected, season)
+
+
+def main():
+    st.set_page_config(layout="wide")
+    begin_perf_run('full')
+    start = time.perf_counter()
+    if st.session_state.pop('perf_profile_next', False):
+        run_profiled(render_app)
+    else:
+        render_app()
+    with st.sidebar:
+        render_perf_panel((time.perf_counter() - start) * 1000)
+
 
-        # シーズン動向分析
-        with Trend_tab:
-            render_trend_analysis(df, 'J3', TEAM_COLORS, available_vars)
+if __name__ == '__main__':
+    main()
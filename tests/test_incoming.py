@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import streamlit_project as app  # noqa: E402
+
+
+def league_store() -> app.LeagueStore:
+    df = pd.DataFrame({
+        'Team': ['A', 'B'],
+        'Match ID': [1, 1],
+        'Match Date': ['2025-02-15', '2025-02-15'],
+        'Distance': [100.0, 110.0],
+    })
+    return app.LeagueStore('J1', app.prepare_league_frame(df, 'J1'))
+
+
+def write_incoming(file_name: str, df: pd.DataFrame, age_seconds: float = 60) -> str:
+    directory = os.path.join(app.INCOMING_DIR, 'J1')
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, file_name)
+    df.to_csv(path, index=False)
+    mtime = time.time() - age_seconds
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def next_match(match_id: int = 2) -> pd.DataFrame:
+    return pd.DataFrame({
+        'Team': ['A', 'B'],
+        'Match ID': [match_id, match_id],
+        'Match Date': ['2025-02-22', '2025-02-22'],
+        'Distance': [120.0, 130.0],
+    })
+
+
+def test_invalid_file_is_skipped_and_not_reread(tmp_path, monkeypatch, caplog):
+    monkeypatch.chdir(tmp_path)
+    store = league_store()
+    write_incoming('01.csv', pd.DataFrame({'Team': ['A'], 'Match ID': [2]}))
+    write_incoming('02.csv', next_match())
+
+    assert store.ingest_incoming() == 2
+    assert 'Match Date' in caplog.text
+    assert len(store.frame) == 4
+
+    caplog.clear()
+    assert store.ingest_incoming() == 0
+    assert caplog.text == ''
+
+
+def test_failed_file_is_retried_after_it_changes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = league_store()
+    write_incoming('01.csv', pd.DataFrame({'Team': ['A'], 'Match ID': [2]}), age_seconds=120)
+    assert store.ingest_incoming() == 0
+
+    write_incoming('01.csv', next_match())
+    assert store.ingest_incoming() == 2
+
+
+def test_recently_modified_file_waits_until_settled(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = league_store()
+    path = write_incoming('01.csv', next_match(), age_seconds=0)
+    assert store.ingest_incoming() == 0
+
+    mtime = time.time() - 60
+    os.utime(path, (mtime, mtime))
+    assert store.ingest_incoming() == 2
+    assert store.frame.groupby('Team')['Matchday'].max().tolist() == [2, 2]
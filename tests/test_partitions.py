@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import streamlit_project as app  # noqa: E402
+
+
+def test_match_league_file_splits_season_and_tag():
+    match = app.match_league_file('WE', '2025_WE_League_physical_data.csv')
+    assert (match.group(1), match.group(2)) == ('2025', 'WE_League')
+
+
+def test_match_league_file_names_the_bad_entry():
+    with pytest.raises(ValueError, match="LEAGUE_FILE_MAP\\['J4'\\] = 'j4.csv'"):
+        app.match_league_file('J4', 'j4.csv')
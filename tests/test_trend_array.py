@@ -0,0 +1,39 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import streamlit_project as app  # noqa: E402
+
+
+def postponed_match_frame() -> pd.DataFrame:
+    # M1 (A vs B) が延期され、B は先に M3 (B vs C) を消化した: M1 は A の第1節、B の第2節
+    return pd.DataFrame({
+        'Team': ['B', 'C', 'A', 'B', 'A', 'C'],
+        'Match ID': ['M3', 'M3', 'M1', 'M1', 'M4', 'M4'],
+        'Matchday': [1, 1, 1, 2, 2, 2],
+        'Distance': [99.0, 50.0, 10.0, 20.0, 30.0, 40.0],
+    })
+
+
+def test_opponent_series_uses_opponent_matchday_of_same_match():
+    trend_array = app.build_trend_array(app.build_match_table(postponed_match_frame()))
+    names, values = trend_array.opponent_series('A', 'Distance')
+    assert names[:2].tolist() == ['B', 'C']
+    np.testing.assert_allclose(values[:2], [20.0, 40.0])
+    assert np.isnan(values[2:]).all()
+
+    names, values = trend_array.opponent_series('B', 'Distance')
+    assert names[:2].tolist() == ['C', 'A']
+    np.testing.assert_allclose(values[:2], [50.0, 10.0])
+
+
+def test_opponent_series_matches_match_table_lookup():
+    match_table = app.build_match_table(postponed_match_frame())
+    trend_array = app.build_trend_array(match_table)
+    for (team, match_id), row in match_table.iterrows():
+        _, values = trend_array.opponent_series(team, 'Distance')
+        expected = match_table.loc[(row['Opponent'], match_id), 'Distance']
+        assert values[int(row['Matchday']) - 1] == expected